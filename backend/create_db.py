@@ -1,9 +1,10 @@
 from .database import engine, Base
-from .models import Team, Player, Fixture, PlayerStats
+from .models import Team, Player, Fixture, PlayerStats, create_missing_indexes
 
 def init_db():
     print("Creating database tables...")
     Base.metadata.create_all(bind=engine)
+    create_missing_indexes(engine)
     print("Database initialized successfully.")
 
 if __name__ == "__main__":
@@ -1,11 +1,18 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from . import models, schemas
 
-def get_player(db: Session, player_id: int):
-    return db.query(models.Player).filter(models.Player.id == player_id).first()
+# The create_* helpers only add the new row to the session; callers flush and
+# commit once per batch instead of paying a commit per row.
+# Bulk writes should go through upsert.upsert_ignore, which skips the ORM entirely.
 
-def get_players(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Player).offset(skip).limit(limit).all()
+async def get_player(db: AsyncSession, player_id: int):
+    return await db.get(models.Player, player_id)
+
+async def get_players(db: AsyncSession, skip: int = 0, limit: int = 100):
+    result = await db.execute(select(models.Player).offset(skip).limit(limit))
+    return result.scalars().all()
 
 def create_player(db: Session, player: schemas.PlayerCreate):
     db_player = models.Player(
@@ -16,12 +23,11 @@ def create_player(db: Session, player: schemas.PlayerCreate):
         position=player.position
     )
     db.add(db_player)
-    db.commit()
-    db.refresh(db_player)
     return db_player
 
-def get_fixtures(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Fixture).offset(skip).limit(limit).all()
+async def get_fixtures(db: AsyncSession, skip: int = 0, limit: int = 100):
+    result = await db.execute(select(models.Fixture).offset(skip).limit(limit))
+    return result.scalars().all()
 
 def create_fixture(db: Session, fixture: schemas.FixtureCreate):
     db_fixture = models.Fixture(
@@ -32,12 +38,11 @@ def create_fixture(db: Session, fixture: schemas.FixtureCreate):
         kickoff_time=fixture.kickoff_time
     )
     db.add(db_fixture)
-    db.commit()
-    db.refresh(db_fixture)
     return db_fixture
 
-def get_teams(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Team).offset(skip).limit(limit).all()
+async def get_teams(db: AsyncSession, skip: int = 0, limit: int = 100):
+    result = await db.execute(select(models.Team).offset(skip).limit(limit))
+    return result.scalars().all()
 
 def create_team(db: Session, team: schemas.TeamCreate):
     db_team = models.Team(
@@ -46,8 +51,6 @@ def create_team(db: Session, team: schemas.TeamCreate):
         short_name=team.short_name
     )
     db.add(db_team)
-    db.commit()
-    db.refresh(db_team)
     return db_team
 
 def create_player_stats(db: Session, stats: schemas.PlayerStatsCreate):
@@ -60,8 +63,6 @@ def create_player_stats(db: Session, stats: schemas.PlayerStatsCreate):
         total_points=stats.total_points
     )
     db.add(db_stats)
-    db.commit()
-    db.refresh(db_stats)
     return db_stats
 
 def create_model_features(db: Session, features: schemas.ModelFeaturesCreate):
@@ -75,6 +76,4 @@ def create_model_features(db: Session, features: schemas.ModelFeaturesCreate):
         minutes_consistency=features.minutes_consistency
     )
     db.add(db_features)
-    db.commit()
-    db.refresh(db_features)
     return db_features
@@ -1,17 +1,60 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 import os
 
 # Ensure the database is created in the backend directory or a specific data directory
 # For now, let's put it in the data directory for better organization
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, "data", "fantasy.db")
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DB_PATH}")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Connections are reused across requests instead of opened per session
+POOL_SIZE = 20
+MAX_OVERFLOW = 20
+POOL_RECYCLE = 1800  # seconds
+
+# asyncio drivers used by the API for each backend
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def _engine_options(url, queue_pool):
+    if url.startswith("sqlite"):
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # An in-memory database only exists on its one connection, so share it
+            return {"connect_args": {"check_same_thread": False}, "poolclass": StaticPool}
+        return {
+            "connect_args": {"check_same_thread": False},
+            "poolclass": queue_pool,
+            "pool_size": POOL_SIZE,
+            "max_overflow": MAX_OVERFLOW
+        }
+    return {
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_pre_ping": True,
+        "pool_recycle": POOL_RECYCLE
+    }
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(SQLALCHEMY_DATABASE_URL, QueuePool))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the FastAPI handlers; scripts keep using the sync engine
+_url = make_url(SQLALCHEMY_DATABASE_URL)
+ASYNC_DATABASE_URL = _url.set(
+    drivername=ASYNC_DRIVERS.get(_url.get_backend_name(), _url.drivername)
+).render_as_string(hide_password=False)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **_engine_options(SQLALCHEMY_DATABASE_URL, AsyncAdaptedQueuePool)
+)
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
@@ -1,150 +1,199 @@
-import json
 import os
 import sys
+import itertools
+import ijson
+# zstandard is optional; it is only needed to read compressed (.zst) raw files
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from .database import SessionLocal, engine
-from . import models, schemas, crud
+from . import models
+from .upsert import upsert_ignore, upsert_update
 
 # Create tables if they don't exist
 models.Base.metadata.create_all(bind=engine)
+models.create_missing_indexes(engine)
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'raw')
 
-def load_json(filename):
+# Rows per bulk insert statement
+CHUNK_SIZE = 10000
+
+# SQLite settings for the duration of the load: the journal is synced once per
+# phase commit instead of on every write, and temp tables/cache stay in memory
+SQLITE_ETL_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -200000,  # KiB, ~200MB
+}
+# SQLite's defaults, restored once the load is done since the connection goes
+# back to the pool; journal_mode stays WAL, which is kept in the database file
+SQLITE_SERVING_PRAGMAS = {
+    'synchronous': 'FULL',
+    'temp_store': 'DEFAULT',
+    'cache_size': -2000,  # KiB, ~2MB
+}
+
+def raw_path(filename):
+    """Path of a raw JSON file, preferring its zstd-compressed copy if there is one"""
     filepath = os.path.join(DATA_DIR, filename)
-    with open(filepath, 'r') as f:
-        return json.load(f)
+    if os.path.exists(filepath + '.zst'):
+        return filepath + '.zst'
+    return filepath
+
+def iter_items(filename, prefix):
+    """Stream the objects under `prefix` of a raw JSON file one at a time"""
+    filepath = raw_path(filename)
+    with open(filepath, 'rb') as f:
+        if filepath.endswith('.zst'):
+            if zstandard is None:
+                raise ImportError(f"zstandard is required to read {filepath}")
+            # Decompressed as ijson reads, never held whole in memory
+            with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+                yield from ijson.items(reader, prefix, use_float=True)
+        else:
+            yield from ijson.items(f, prefix, use_float=True)
+
+def chunked(iterable, size=CHUNK_SIZE):
+    """Group an iterable into lists of at most `size` items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def optional_float(value):
+    return float(value) if value is not None else None
+
+def set_sqlite_pragmas(db, pragmas):
+    """Apply PRAGMAs to the session's connection; a no-op on other databases"""
+    if db.get_bind().dialect.name != 'sqlite':
+        return
+    for name, value in pragmas.items():
+        db.execute(text(f"PRAGMA {name}={value}"))
 
 def etl_process():
     db = SessionLocal()
     try:
         print("Starting ETL process...")
+        set_sqlite_pragmas(db, SQLITE_ETL_PRAGMAS)
 
-        # Load Bootstrap Static Data
-        bootstrap_data = load_json('bootstrap_static.json')
-        
         # Process Teams
         print("Processing Teams...")
-        teams = bootstrap_data.get('teams', [])
-        for team_data in teams:
-            team_in = schemas.TeamCreate(
-                id=team_data['id'],
-                name=team_data['name'],
-                short_name=team_data['short_name']
-            )
-            # Check if exists to avoid duplicates (simple check)
-            existing = db.query(models.Team).filter(models.Team.id == team_in.id).first()
-            if not existing:
-                crud.create_team(db, team_in)
-        
+        for teams in chunked(iter_items('bootstrap_static.json', 'teams.item')):
+            team_rows = [
+                {
+                    'id': team_data['id'],
+                    'name': team_data['name'],
+                    'short_name': team_data['short_name']
+                }
+                for team_data in teams
+            ]
+            upsert_ignore(db, models.Team, team_rows, ['id'])
+        db.commit()
+
         # Process Players
         print("Processing Players...")
-        players = bootstrap_data.get('elements', [])
-        for player_data in players:
-            player_in = schemas.PlayerCreate(
-                id=player_data['id'],
-                first_name=player_data['first_name'],
-                second_name=player_data['second_name'],
-                team_id=player_data['team'],
-                position=player_data['element_type']
+
+        # 'a'=available, 'd'=doubtful, 'i'=injured, 'u'=unavailable
+        injury_status_map = {
+            'a': None,
+            'd': 'Doubtful',
+            'i': 'Injured',
+            'u': 'Unavailable'
+        }
+
+        for players in chunked(iter_items('bootstrap_static.json', 'elements.item')):
+            player_rows = []
+            injury_rows = []
+            for player_data in players:
+                player_rows.append({
+                    'id': player_data['id'],
+                    'first_name': player_data['first_name'],
+                    'second_name': player_data['second_name'],
+                    'team_id': player_data['team'],
+                    'position': player_data['element_type']
+                })
+
+                # Process injury status
+                status = player_data.get('status', 'a')
+                injury_rows.append({
+                    'player_id': player_data['id'],
+                    'is_injured': status != 'a',
+                    'injury_status_name': injury_status_map.get(status),
+                    'expected_return': player_data.get('news_return_date')
+                })
+
+            upsert_ignore(db, models.Player, player_rows, ['id'])
+            # Existing injury statuses are refreshed in the same statement
+            upsert_update(
+                db, models.InjuryStatus, injury_rows, ['player_id'],
+                ['is_injured', 'injury_status_name', 'expected_return']
             )
-            existing = db.query(models.Player).filter(models.Player.id == player_in.id).first()
-            if not existing:
-                crud.create_player(db, player_in)
-            
-            # Process injury status
-            status = player_data.get('status', 'a')  # 'a'=available, 'd'=doubtful, 'i'=injured, 'u'=unavailable
-            injury_status_map = {
-                'a': None,
-                'd': 'Doubtful',
-                'i': 'Injured',
-                'u': 'Unavailable'
-            }
-            injury_status_name = injury_status_map.get(status)
-            is_injured = status != 'a'
-            
-            existing_injury = db.query(models.InjuryStatus).filter(
-                models.InjuryStatus.player_id == player_data['id']
-            ).first()
-            
-            if not existing_injury:
-                injury_record = models.InjuryStatus(
-                    player_id=player_data['id'],
-                    is_injured=is_injured,
-                    injury_status_name=injury_status_name,
-                    expected_return=player_data.get('news_return_date')
-                )
-                db.add(injury_record)
-                db.commit()
-            else:
-                # Update existing injury status
-                existing_injury.is_injured = is_injured
-                existing_injury.injury_status_name = injury_status_name
-                existing_injury.expected_return = player_data.get('news_return_date')
-                db.commit()
-
-        # Load Fixtures Data
-        fixtures_data = load_json('fixtures.json')
-        
+        db.commit()
+
         # Process Fixtures
         print("Processing Fixtures...")
-        for fixture_data in fixtures_data:
-            try:
-                fixture_in = schemas.FixtureCreate(
-                    id=fixture_data['id'],
-                    event=fixture_data['event'],
-                    team_h=fixture_data['team_h'],
-                    team_a=fixture_data['team_a'],
-                    kickoff_time=fixture_data['kickoff_time']
-                )
-                existing = db.query(models.Fixture).filter(models.Fixture.id == fixture_in.id).first()
-                if not existing:
-                    crud.create_fixture(db, fixture_in)
-            except Exception as e:
-                print(f"Error processing fixture {fixture_data.get('id')}: {e}")
+        for fixtures in chunked(iter_items('fixtures.json', 'item')):
+            fixture_rows = []
+            for fixture_data in fixtures:
+                try:
+                    fixture_rows.append({
+                        'id': fixture_data['id'],
+                        'event': fixture_data['event'],
+                        'team_h': fixture_data['team_h'],
+                        'team_a': fixture_data['team_a'],
+                        'kickoff_time': fixture_data['kickoff_time']
+                    })
+                except Exception as e:
+                    print(f"Error processing fixture {fixture_data.get('id')}: {e}")
+            upsert_ignore(db, models.Fixture, fixture_rows, ['id'])
+        db.commit()
 
         # Process Player Stats (History)
         print("Processing Player Stats...")
-        players = db.query(models.Player).all()
-        for player in players:
+        player_ids = [r[0] for r in db.query(models.Player.id).all()]
+        stats_rows = []
+        for player_id in player_ids:
             try:
-                player_file = f"player_{player.id}.json"
-                if not os.path.exists(os.path.join(DATA_DIR, player_file)):
+                player_file = f"player_{player_id}.json"
+                if not os.path.exists(raw_path(player_file)):
                     continue
-                
-                player_data = load_json(player_file)
-                history = player_data.get('history', [])
-                
-                for match in history:
-                    stats_in = schemas.PlayerStatsCreate(
-                        player_id=player.id,
-                        fixture_id=match['fixture'],
-                        minutes=match['minutes'],
-                        goals_scored=match['goals_scored'],
-                        assists=match['assists'],
-                        total_points=match['total_points'],
-                        xG=match.get('expected_goals'),
-                        xA=match.get('expected_assists'),
-                        shots=match.get('shots_on_target')
-                    )
-                    # Check if exists (composite key check would be better, but for now simple check)
-                    # Assuming we don't have a unique constraint on player_id + fixture_id in models yet, 
-                    # but we should probably check if we already loaded this match for this player.
-                    existing_stats = db.query(models.PlayerStats).filter(
-                        models.PlayerStats.player_id == stats_in.player_id,
-                        models.PlayerStats.fixture_id == stats_in.fixture_id
-                    ).first()
-                    
-                    if not existing_stats:
-                        crud.create_player_stats(db, stats_in)
+
+                for match in iter_items(player_file, 'history.item'):
+                    stats_rows.append({
+                        'player_id': player_id,
+                        'fixture_id': match['fixture'],
+                        'minutes': match['minutes'],
+                        'goals_scored': match['goals_scored'],
+                        'assists': match['assists'],
+                        'total_points': match['total_points'],
+                        'xG': optional_float(match.get('expected_goals')),
+                        'xA': optional_float(match.get('expected_assists')),
+                        'shots': match.get('shots_on_target')
+                    })
             except Exception as e:
-                print(f"Error processing stats for player {player.id}: {e}")
+                print(f"Error processing stats for player {player_id}: {e}")
+
+            if len(stats_rows) >= CHUNK_SIZE:
+                upsert_ignore(db, models.PlayerStats, stats_rows, ['player_id', 'fixture_id'])
+                stats_rows = []
+
+        upsert_ignore(db, models.PlayerStats, stats_rows, ['player_id', 'fixture_id'])
+        db.commit()
 
         print("ETL process completed successfully.")
 
     except Exception as e:
         print(f"An error occurred: {e}")
+        db.rollback()
     finally:
+        set_sqlite_pragmas(db, SQLITE_SERVING_PRAGMAS)
         db.close()
 
 if __name__ == "__main__":
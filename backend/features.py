@@ -3,10 +3,12 @@ import json
 import numpy as np
 from sqlalchemy.orm import Session
 from .database import SessionLocal, engine
-from . import models, schemas, crud
+from . import models
+from .upsert import upsert_ignore
 
 # Ensure tables exist
 models.Base.metadata.create_all(bind=engine)
+models.create_missing_indexes(engine)
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'raw')
 
@@ -27,6 +29,37 @@ def get_team_strength_map():
         print(f"Could not load team strengths: {e}")
         return {}
 
+# Number of past matches used by the rolling features
+ROLLING_WINDOW = 5
+
+# Pending feature rows are written to the database in batches of this size
+FLUSH_EVERY = 1000
+
+def trailing_window_sums(values, window=ROLLING_WINDOW):
+    """
+    Sum of the `window` values before each index (past data only), along the last axis.
+    Returns (sums, counts) where counts is the number of past values in each window.
+    """
+    values = np.asarray(values)
+    zeros = np.zeros(values.shape[:-1] + (1,), dtype=values.dtype)
+    csum = np.concatenate((zeros, np.cumsum(values, axis=-1)), axis=-1)
+    end = np.arange(values.shape[-1])
+    start = np.maximum(end - window, 0)
+    return csum[..., end] - csum[..., start], end - start
+
+def trailing_window_mean(values, window=ROLLING_WINDOW):
+    """Mean of the past window for each index, 0 where there is no history"""
+    sums, counts = trailing_window_sums(values, window)
+    return np.divide(sums, counts, out=np.zeros(sums.shape), where=counts > 0)
+
+def trailing_window_var(values, window=ROLLING_WINDOW):
+    """Population variance of the past window for each index, 0 with fewer than 2 values"""
+    values = np.asarray(values)
+    sums, counts = trailing_window_sums(values, window)
+    sq_sums, _ = trailing_window_sums(values * values, window)
+    numerator = np.maximum(counts * sq_sums - sums * sums, 0)
+    return np.divide(numerator, counts * counts, out=np.zeros(sums.shape), where=counts > 1)
+
 def calculate_features():
     db = SessionLocal()
     try:
@@ -37,6 +70,7 @@ def calculate_features():
         # Fetch all players
         players = db.query(models.Player).all()
         
+        pending_rows = []
         for player in players:
             # Fetch stats for this player, ordered by fixture? 
             # We need to order by event/date. Fixture has 'event'.
@@ -48,12 +82,15 @@ def calculate_features():
             if not stats:
                 continue
                 
-            # Calculate rolling features
-            # We need to store history to calculate rolling averages
-            points_history = []
-            minutes_history = []
+            # Calculate rolling features for every match at once.
+            # Each window only covers matches BEFORE the one it belongs to, so the
+            # features for a match never include that match's own stats.
+            points = np.fromiter((s.total_points for s in stats), dtype=np.int64, count=len(stats))
+            minutes = np.fromiter((s.minutes for s in stats), dtype=np.int64, count=len(stats))
+            avg_points_last_5 = trailing_window_mean(points)
+            minutes_consistency = np.sqrt(trailing_window_var(minutes))
             
-            for stat in stats:
+            for i, stat in enumerate(stats):
                 fixture = db.query(models.Fixture).filter(models.Fixture.id == stat.fixture_id).first()
                 if not fixture:
                     continue
@@ -70,37 +107,27 @@ def calculate_features():
                 
                 # Rolling features (using past data only)
                 # For the FIRST match, history is empty.
-                avg_points_last_5 = np.mean(points_history[-5:]) if points_history else 0
-                minutes_consistency = np.std(minutes_history[-5:]) if len(minutes_history) > 1 else 0
-                form = avg_points_last_5 # Simple form definition
+                form = avg_points_last_5[i] # Simple form definition
                 
-                # Update history AFTER calculating features for THIS match (to avoid leakage if we were predicting this match)
-                # BUT, wait. 
-                # If we are training a model to predict 'total_points' for THIS match, 
-                # we must use features available BEFORE the match.
-                # So yes, calculate using history, THEN append current match stats to history.
-                
-                feature_in = schemas.ModelFeaturesCreate(
+                feature_row = dict(
                     player_id=player.id,
                     fixture_id=stat.fixture_id,
-                    avg_points_last_5=float(avg_points_last_5),
+                    avg_points_last_5=float(avg_points_last_5[i]),
                     form=float(form),
                     opponent_difficulty=opponent_difficulty,
                     is_home=is_home,
-                    minutes_consistency=float(minutes_consistency)
+                    minutes_consistency=float(minutes_consistency[i])
                 )
                 
-                # Check if exists
-                existing = db.query(models.ModelFeatures).filter(
-                    models.ModelFeatures.player_id == feature_in.player_id,
-                    models.ModelFeatures.fixture_id == feature_in.fixture_id
-                ).first()
-                
-                if not existing:
-                    crud.create_model_features(db, feature_in)
-                
-                points_history.append(stat.total_points)
-                minutes_history.append(stat.minutes)
+                pending_rows.append(feature_row)
+            
+            # Rows that already exist are skipped by the unique (player_id, fixture_id) index
+            if len(pending_rows) >= FLUSH_EVERY:
+                upsert_ignore(db, models.ModelFeatures, pending_rows, ['player_id', 'fixture_id'])
+                pending_rows = []
+        
+        upsert_ignore(db, models.ModelFeatures, pending_rows, ['player_id', 'fixture_id'])
+        db.commit()
 
         print("Feature Engineering completed successfully.")
 
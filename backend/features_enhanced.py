@@ -8,13 +8,19 @@ Enhanced feature engineering including:
 
 import os
 import json
+import functools
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from sqlalchemy.orm import Session
 from .database import SessionLocal, engine
-from . import models, schemas, crud
+from . import models
+from .upsert import upsert_ignore
+from .features import ROLLING_WINDOW, FLUSH_EVERY, trailing_window_sums, trailing_window_mean, trailing_window_var
 
 # Ensure tables exist
 models.Base.metadata.create_all(bind=engine)
+models.create_missing_indexes(engine)
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'raw')
 
@@ -27,6 +33,10 @@ def load_json(filename):
         return json.load(f)
 
 
+# The raw-data loaders below are cached for the life of the process, since the
+# files only change when the scraper runs. Call clear_raw_data_cache() to reload.
+
+@functools.lru_cache(maxsize=1)
 def get_team_strength_map():
     """Load team strengths from bootstrap static data"""
     try:
@@ -38,6 +48,7 @@ def get_team_strength_map():
         return {}
 
 
+@functools.lru_cache(maxsize=1)
 def get_understat_player_stats():
     """Load Understat player data indexed by player name"""
     try:
@@ -48,6 +59,7 @@ def get_understat_player_stats():
         return {}
 
 
+@functools.lru_cache(maxsize=1)
 def get_team_xG_stats():
     """Load team xG/xGA stats from Understat"""
     try:
@@ -58,110 +70,132 @@ def get_team_xG_stats():
         return {}
 
 
-def calculate_minutes_trend(minutes_history):
+def clear_raw_data_cache():
+    """Forget cached team strengths and Understat data so the next call reloads them"""
+    get_team_strength_map.cache_clear()
+    get_understat_player_stats.cache_clear()
+    get_team_xG_stats.cache_clear()
+
+
+def calculate_minutes_trend(minutes, window=ROLLING_WINDOW):
     """
-    Calculate if minutes are increasing or decreasing.
+    Calculate if minutes are increasing or decreasing over the past window of each match.
     Positive = increasing minutes (good trend)
     Negative = decreasing minutes (injury/rotation risk)
     """
-    if len(minutes_history) < 2:
-        return 0.0
-    
-    # Simple linear regression trend
-    x = np.arange(len(minutes_history))
-    y = np.array(minutes_history)
-    
-    # Remove zeros to avoid skewing if player had games with 0 minutes
-    non_zero_indices = y > 0
-    if not any(non_zero_indices):
-        return 0.0
+    # Closed-form least-squares slope over the non-zero minutes of each window,
+    # zeros are removed to avoid skewing if player had games with 0 minutes
+    played = (minutes > 0).astype(np.int64)
+    x = np.arange(len(minutes))
+    n, _ = trailing_window_sums(played, window)
+    sum_x, _ = trailing_window_sums(played * x, window)
+    sum_y, _ = trailing_window_sums(played * minutes, window)
+    sum_xy, _ = trailing_window_sums(played * x * minutes, window)
+    sum_xx, _ = trailing_window_sums(played * x * x, window)
     
-    x_nonzero = x[non_zero_indices]
-    y_nonzero = y[non_zero_indices]
-    
-    if len(y_nonzero) < 2:
-        return 0.0
-    
-    # Calculate slope of trend line
-    slope = np.polyfit(x_nonzero, y_nonzero, 1)[0]
-    return float(slope)
+    denominator = n * sum_xx - sum_x * sum_x
+    return np.divide(n * sum_xy - sum_x * sum_y, denominator,
+                     out=np.zeros(len(minutes)), where=denominator > 0)
 
 
-def calculate_games_with_minutes(minutes_history, threshold=1):
-    """Calculate percentage of games where player got significant minutes"""
-    if not minutes_history:
-        return 0.0
-    
-    games_with_minutes = sum(1 for m in minutes_history if m >= threshold)
-    return float(games_with_minutes / len(minutes_history))
+def calculate_games_with_minutes(minutes, threshold=1, window=ROLLING_WINDOW):
+    """Calculate percentage of past games where player got significant minutes"""
+    return trailing_window_mean((minutes >= threshold).astype(np.int64), window)
+
+
+# Only the columns the features read, fetched as plain rows rather than ORM objects
+STATS_COLUMNS = (
+    models.PlayerStats.player_id,
+    models.PlayerStats.fixture_id,
+    models.PlayerStats.total_points,
+    models.PlayerStats.minutes,
+    models.PlayerStats.goals_scored,
+    models.PlayerStats.xG,
+    models.PlayerStats.xA,
+    models.PlayerStats.shots,
+    models.Fixture.team_h,
+    models.Fixture.team_a,
+)
 
+# Worker processes for per-player feature math (None = one per CPU)
+MAX_WORKERS = None
+# Players handed to a worker at a time
+WORKER_CHUNKSIZE = 32
 
-def calculate_features_for_player(db, player, team_strengths, understat_data, team_xg_data):
-    """Calculate all features for a single player"""
+# Rows of the per-player history buffer
+HISTORY_FIELDS = ('total_points', 'minutes', 'goals_scored', 'xG', 'xA', 'shots')
+POINTS, MINUTES, GOALS, XG, XA, SHOTS = range(len(HISTORY_FIELDS))
+
+
+def calculate_features_for_player(player, stats, team_strengths, understat_data, team_xg_data, teams_by_id):
+    """
+    Calculate all features for a single player.
+    `stats` is the player's list of STATS_COLUMNS rows ordered by fixture event.
+    Returns the player's ModelFeatures rows as dicts.
+    """
+    feature_rows = []
+    if not stats:
+        return feature_rows
     
-    # Fetch stats for this player, ordered by fixture event
-    stats = db.query(models.PlayerStats).join(models.Fixture).filter(
-        models.PlayerStats.player_id == player.id
-    ).order_by(models.Fixture.event).all()
+    # Build the history buffer for feature calculation: one row per stat
+    # (HISTORY_FIELDS order), one column per match. Missing values land as NaN
+    # and are zeroed in one pass afterwards.
+    n = len(stats)
+    history = np.empty((len(HISTORY_FIELDS), n))
+    for i, r in enumerate(stats):
+        history[:, i] = (r.total_points, r.minutes, r.goals_scored, r.xG, r.xA, r.shots)
+    np.nan_to_num(history, copy=False, nan=0.0)
+    minutes = history[MINUTES]
     
-    if not stats:
-        return
+    # === CALCULATE FEATURES USING PAST DATA ONLY ===
+    # Every window ends just before its own match, so no match sees its own stats
+    sums, history_len = trailing_window_sums(history)
+    means = np.divide(sums, history_len, out=np.zeros(sums.shape), where=history_len > 0)
+    
+    # 1. Traditional Features
+    avg_points_last_5 = means[POINTS]
+    minutes_variance = trailing_window_var(minutes)
+    minutes_consistency = np.sqrt(minutes_variance)
+    
+    # 2. Minutes & Playing Time Features
+    avg_minutes_last_5 = means[MINUTES]
+    minutes_trend = calculate_minutes_trend(minutes)
+    games_with_minutes = calculate_games_with_minutes(minutes)
     
-    # Build history for feature calculation
-    points_history = []
-    minutes_history = []
-    xg_history = []
-    xa_history = []
-    shots_history = []
-    goals_history = []
+    # 3. Understat Features (xG, xA, etc.)
+    avg_xG_last_5 = means[XG]
+    avg_xA_last_5 = means[XA]
+    avg_shots_last_5 = means[SHOTS]
+    
+    # xG outperformance: actual goals vs expected goals
+    total_xg = sums[XG]
+    total_goals = sums[GOALS]
+    matches_with_xg, _ = trailing_window_sums((history[XG] > 0).astype(np.int64))
     
     # Get player name for Understat lookup
     player_fullname = f"{player.first_name} {player.second_name}".strip()
     player_understat = understat_data.get(player_fullname, {})
     
-    for stat in stats:
-        fixture = db.query(models.Fixture).filter(models.Fixture.id == stat.fixture_id).first()
-        if not fixture:
-            continue
-        
+    # Team context only depends on the player's own team
+    team = teams_by_id.get(player.team_id)
+    team_stats = team_xg_data.get(team.name) if team else {}
+    
+    for i, row in enumerate(stats):
         # Determine home/away
-        is_home = 1 if player.team_id == fixture.team_h else 0
-        opponent_id = fixture.team_a if is_home else fixture.team_h
+        is_home = 1 if player.team_id == row.team_h else 0
+        opponent_id = row.team_a if is_home else row.team_h
         
         opponent_difficulty = team_strengths.get(opponent_id, 3)
         
-        # === CALCULATE FEATURES USING PAST DATA ONLY ===
-        
-        # 1. Traditional Features
-        avg_points_last_5 = np.mean(points_history[-5:]) if points_history else 0.0
-        form = avg_points_last_5
-        minutes_consistency = np.std(minutes_history[-5:]) if len(minutes_history) > 1 else 0.0
-        
-        # 2. Minutes & Playing Time Features
-        avg_minutes_last_5 = np.mean(minutes_history[-5:]) if minutes_history else 0.0
-        minutes_trend = calculate_minutes_trend(minutes_history[-5:])
-        minutes_variance = np.var(minutes_history[-5:]) if len(minutes_history) > 1 else 0.0
-        games_with_minutes = calculate_games_with_minutes(minutes_history[-5:])
-        
-        # 3. Understat Features (xG, xA, etc.)
-        avg_xG_last_5 = np.mean(xg_history[-5:]) if xg_history else None
-        avg_xA_last_5 = np.mean(xa_history[-5:]) if xa_history else None
-        avg_shots_last_5 = np.mean(shots_history[-5:]) if shots_history else None
-        
-        # xG outperformance: actual goals vs expected goals
-        if xg_history:
-            total_xg = sum(xg_history[-5:])
-            total_goals = sum(goals_history[-5:])
-            xG_outperformance = float(total_goals - total_xg) if total_xg > 0 else None
+        has_history = history_len[i] > 0
+        if matches_with_xg[i] > 0:
+            xG_outperformance = float(total_goals[i] - total_xg[i])
         else:
             xG_outperformance = None
         
         # 4. Team Context Features
-        opponent_name = db.query(models.Team).filter(models.Team.id == opponent_id).first()
-        opponent_team_stats = team_xg_data.get(opponent_name.name if opponent_name else '') if opponent_name else {}
-        
-        team_name = db.query(models.Team).filter(models.Team.id == player.team_id).first()
-        team_stats = team_xg_data.get(team_name.name if team_name else '') if team_name else {}
+        opponent = teams_by_id.get(opponent_id)
+        opponent_team_stats = team_xg_data.get(opponent.name) if opponent else {}
         
         # Team's average xG (how attacking is the team)
         if team_stats and team_stats.get('matches_played', 0) > 0:
@@ -176,42 +210,48 @@ def calculate_features_for_player(db, player, team_strengths, understat_data, te
             opponent_xGA = None
         
         # Create feature record
-        feature_in = schemas.ModelFeaturesCreate(
+        feature_row = dict(
             player_id=player.id,
-            fixture_id=stat.fixture_id,
-            avg_points_last_5=float(avg_points_last_5),
-            form=float(form),
+            fixture_id=row.fixture_id,
+            avg_points_last_5=float(avg_points_last_5[i]),
+            form=float(avg_points_last_5[i]),
             opponent_difficulty=opponent_difficulty,
             is_home=is_home,
-            minutes_consistency=float(minutes_consistency),
-            avg_minutes_last_5=float(avg_minutes_last_5) if avg_minutes_last_5 else None,
-            minutes_trend=float(minutes_trend) if minutes_trend else None,
-            minutes_variance=float(minutes_variance) if minutes_variance else None,
-            games_with_minutes=float(games_with_minutes) if games_with_minutes else None,
-            avg_xG_last_5=avg_xG_last_5,
-            avg_xA_last_5=avg_xA_last_5,
-            avg_shots_last_5=avg_shots_last_5,
+            minutes_consistency=float(minutes_consistency[i]),
+            avg_minutes_last_5=float(avg_minutes_last_5[i]) if avg_minutes_last_5[i] else None,
+            minutes_trend=float(minutes_trend[i]) if minutes_trend[i] else None,
+            minutes_variance=float(minutes_variance[i]) if minutes_variance[i] else None,
+            games_with_minutes=float(games_with_minutes[i]) if games_with_minutes[i] else None,
+            avg_xG_last_5=float(avg_xG_last_5[i]) if has_history else None,
+            avg_xA_last_5=float(avg_xA_last_5[i]) if has_history else None,
+            avg_shots_last_5=float(avg_shots_last_5[i]) if has_history else None,
             xG_outperformance=xG_outperformance,
             team_xG=team_xG,
             opponent_xGA=opponent_xGA
         )
         
-        # Check if exists
-        existing = db.query(models.ModelFeatures).filter(
-            models.ModelFeatures.player_id == feature_in.player_id,
-            models.ModelFeatures.fixture_id == feature_in.fixture_id
-        ).first()
-        
-        if not existing:
-            crud.create_model_features(db, feature_in)
-        
-        # === UPDATE HISTORY FOR NEXT ITERATION ===
-        points_history.append(stat.total_points)
-        minutes_history.append(stat.minutes)
-        xg_history.append(stat.xG if stat.xG else 0.0)
-        xa_history.append(stat.xA if stat.xA else 0.0)
-        shots_history.append(stat.shots if stat.shots else 0)
-        goals_history.append(stat.goals_scored)
+        feature_rows.append(feature_row)
+    
+    return feature_rows
+
+
+# Lookups shared by every player, set once per worker process by _init_worker
+_worker_context = None
+
+
+def _init_worker(team_strengths, understat_data, team_xg_data, teams_by_id):
+    global _worker_context
+    _worker_context = (team_strengths, understat_data, team_xg_data, teams_by_id)
+
+
+def _compute_for_player(item):
+    """Worker entry point: feature rows for one (player, stats) pair"""
+    player, stats = item
+    try:
+        return calculate_features_for_player(player, stats, *_worker_context)
+    except Exception as e:
+        print(f"Error processing features for player {player.id}: {e}")
+        return []
 
 
 def calculate_features():
@@ -227,18 +267,51 @@ def calculate_features():
         print(f"Loaded {len(understat_data)} player records from Understat")
         print(f"Loaded {len(team_xg_data)} team records from Understat")
         
+        # Teams are looked up per match, so load them once
+        teams_by_id = {t.id: t for t in db.query(models.Team.id, models.Team.name).all()}
+        
         # Fetch all players
-        players = db.query(models.Player).all()
+        players_by_id = {
+            p.id: p for p in db.query(
+                models.Player.id, models.Player.team_id, models.Player.first_name, models.Player.second_name
+            ).all()
+        }
+        
+        # Fetch every player's stats in one query, ordered so each player's
+        # matches are contiguous and in fixture event order
+        rows = db.query(*STATS_COLUMNS).join(
+            models.Fixture, models.PlayerStats.fixture_id == models.Fixture.id
+        ).order_by(
+            models.PlayerStats.player_id, models.Fixture.event
+        ).all()
+        
+        work = [
+            (players_by_id[player_id], list(group))
+            for player_id, group in itertools.groupby(rows, key=lambda r: r.player_id)
+            if player_id in players_by_id
+        ]
         
-        for i, player in enumerate(players):
-            try:
+        # The per-player math is spread over worker processes; only this
+        # process writes, so the features still go in as one transaction
+        pending_rows = []
+        with ProcessPoolExecutor(
+            max_workers=MAX_WORKERS,
+            initializer=_init_worker,
+            initargs=(team_strengths, understat_data, team_xg_data, teams_by_id)
+        ) as executor:
+            results = executor.map(_compute_for_player, work, chunksize=WORKER_CHUNKSIZE)
+            for i, player_rows in enumerate(results):
                 if (i + 1) % 50 == 0:
-                    print(f"Processing player {i + 1}/{len(players)}...")
+                    print(f"Processing player {i + 1}/{len(players_by_id)}...")
+                pending_rows.extend(player_rows)
                 
-                calculate_features_for_player(db, player, team_strengths, understat_data, team_xg_data)
-            except Exception as e:
-                print(f"Error processing features for player {player.id}: {e}")
+                # Rows that already exist are skipped by the unique (player_id, fixture_id) index
+                if len(pending_rows) >= FLUSH_EVERY:
+                    upsert_ignore(db, models.ModelFeatures, pending_rows, ['player_id', 'fixture_id'])
+                    pending_rows = []
         
+        upsert_ignore(db, models.ModelFeatures, pending_rows, ['player_id', 'fixture_id'])
+        db.commit()
         print("Enhanced Feature Engineering completed successfully.")
     
     except Exception as e:
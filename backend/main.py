@@ -1,10 +1,11 @@
 from fastapi import Depends, FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 from . import crud, models, schemas
-from .database import SessionLocal, engine
+from .database import AsyncSessionLocal, SessionLocal, engine
 
 models.Base.metadata.create_all(bind=engine)
 
@@ -19,33 +20,30 @@ app.add_middleware(
 )
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 @app.get("/players/", response_model=List[schemas.Player])
-def read_players(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    players = crud.get_players(db, skip=skip, limit=limit)
+async def read_players(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
+    players = await crud.get_players(db, skip=skip, limit=limit)
     return players
 
 @app.get("/players/{player_id}", response_model=schemas.Player)
-def read_player(player_id: int, db: Session = Depends(get_db)):
-    db_player = crud.get_player(db, player_id=player_id)
+async def read_player(player_id: int, db: AsyncSession = Depends(get_db)):
+    db_player = await crud.get_player(db, player_id=player_id)
     if db_player is None:
         raise HTTPException(status_code=404, detail="Player not found")
     return db_player
 
 @app.get("/fixtures/", response_model=List[schemas.Fixture])
-def read_fixtures(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    fixtures = crud.get_fixtures(db, skip=skip, limit=limit)
+async def read_fixtures(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
+    fixtures = await crud.get_fixtures(db, skip=skip, limit=limit)
     return fixtures
 
 @app.get("/teams/", response_model=List[schemas.Team])
-def read_teams(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    teams = crud.get_teams(db, skip=skip, limit=limit)
+async def read_teams(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
+    teams = await crud.get_teams(db, skip=skip, limit=limit)
     return teams
 
 import sys
@@ -53,10 +51,21 @@ import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml'))
 from predict import predict_gameweek
 
+def run_prediction(**kwargs):
+    # The prediction pipeline (ORM queries + sklearn) is synchronous, so it runs
+    # in the threadpool with its own sync session rather than on the event loop
+    db = SessionLocal()
+    try:
+        return predict_gameweek(db, **kwargs)
+    finally:
+        db.close()
+
 @app.get("/predict/")
-def predict_points(gameweek: int = None, top_n: int = 20, db: Session = Depends(get_db)):
+async def predict_points(gameweek: int = None, top_n: int = 20):
     """Get predictions for a specific gameweek"""
-    predictions, injured = predict_gameweek(db, gameweek=gameweek, top_n=top_n, include_injured=False)
+    predictions, injured = await run_in_threadpool(
+        run_prediction, gameweek=gameweek, top_n=top_n, include_injured=False
+    )
     return {
         "gameweek": gameweek,
         "predictions": predictions,
@@ -64,9 +73,11 @@ def predict_points(gameweek: int = None, top_n: int = 20, db: Session = Depends(
     }
 
 @app.get("/predict/injured/")
-def get_injured_players(gameweek: int = None, db: Session = Depends(get_db)):
+async def get_injured_players(gameweek: int = None):
     """Get list of injured/unavailable players for a gameweek"""
-    predictions, injured = predict_gameweek(db, gameweek=gameweek, top_n=1000, include_injured=False)
+    predictions, injured = await run_in_threadpool(
+        run_prediction, gameweek=gameweek, top_n=1000, include_injured=False
+    )
     return {
         "gameweek": gameweek,
         "injured_players": injured
@@ -1,4 +1,5 @@
 import os
+import itertools
 import joblib
 import pandas as pd
 import numpy as np
@@ -6,12 +7,20 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 from .database import SessionLocal, engine
 from . import models, schemas, crud
+from .features_enhanced import get_team_strength_map
 
-def get_team_strength_map():
-    # Hardcoded for now or load from JSON if needed. 
-    # Since we don't have easy access to JSON here without importing from features.py or duplicating code.
-    # Let's just default to 3 for now to keep it simple, or try to load.
-    return {} # defaulting to 3 in logic
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'model.joblib')
+# Column order of the feature matrix, as used in ml_train
+FEATURE_COLUMNS = ['avg_points_last_5', 'form', 'opponent_difficulty', 'is_home', 'minutes_consistency']
+_MODEL = None
+
+def _get_model():
+    # Load the trained model once and reuse it across calls
+    global _MODEL
+    if _MODEL is None:
+        # Arrays in joblib-format files are memory-mapped rather than copied
+        _MODEL = joblib.load(MODEL_PATH, mmap_mode='r')
+    return _MODEL
 
 def get_predictions(db: Session = None):
     close_db = False
@@ -20,11 +29,10 @@ def get_predictions(db: Session = None):
         close_db = True
         
     try:
-        model_path = os.path.join(os.path.dirname(__file__), 'model.joblib')
-        if not os.path.exists(model_path):
+        if _MODEL is None and not os.path.exists(MODEL_PATH):
             return []
 
-        model = joblib.load(model_path)
+        model = _get_model()
         
         # Determine next gameweek
         max_event = db.query(func.max(models.Fixture.event)).join(
@@ -37,54 +45,86 @@ def get_predictions(db: Session = None):
             next_event = max_event + 1
             
         # Get fixtures for next event
-        fixtures = db.query(models.Fixture).filter(models.Fixture.event == next_event).all()
+        fixtures = db.query(
+            models.Fixture.team_h, models.Fixture.team_a
+        ).filter(models.Fixture.event == next_event).all()
         
         if not fixtures:
             return []
             
-        predictions = []
+        # Get players for every team playing this gameweek
+        team_ids = {f.team_h for f in fixtures} | {f.team_a for f in fixtures}
+        players_by_team = {team_id: [] for team_id in team_ids}
+        for player in db.query(
+            models.Player.id, models.Player.first_name, models.Player.second_name,
+            models.Player.team_id, models.Player.position
+        ).filter(models.Player.team_id.in_(team_ids)).all():
+            players_by_team[player.team_id].append(player)
+        
+        # Fetch each player's history once, in event order, as
+        # player_id -> (points, minutes) arrays
+        player_ids = [p.id for players in players_by_team.values() for p in players]
+        stats_rows = db.query(
+            models.PlayerStats.player_id,
+            models.PlayerStats.total_points,
+            models.PlayerStats.minutes
+        ).join(models.Fixture).filter(
+            models.PlayerStats.player_id.in_(player_ids)
+        ).order_by(models.PlayerStats.player_id, models.Fixture.event).all()
+        
+        history_by_pid = {}
+        for player_id, group in itertools.groupby(stats_rows, key=lambda r: r.player_id):
+            group = list(group)
+            history_by_pid[player_id] = (
+                np.fromiter((r.total_points for r in group), dtype=np.int64, count=len(group)),
+                np.fromiter((r.minutes for r in group), dtype=np.int64, count=len(group))
+            )
+        empty_history = (np.array([], dtype=int), np.array([], dtype=int))
+        
+        # Same opponent strength the training features were built with
+        team_strengths = get_team_strength_map()
+        
+        # Features go straight into a float32 matrix (the dtype the tree models
+        # work in) alongside the player metadata, so the whole gameweek can be
+        # scored with a single predict call
+        n_rows = sum(len(players_by_team[f.team_h]) + len(players_by_team[f.team_a]) for f in fixtures)
+        if n_rows == 0:
+            return []
+        X = np.empty((n_rows, len(FEATURE_COLUMNS)), dtype=np.float32)
+        player_rows = []
         
         for fixture in fixtures:
-            # Get players for home team
-            home_players = db.query(models.Player).filter(models.Player.team_id == fixture.team_h).all()
-            # Get players for away team
-            away_players = db.query(models.Player).filter(models.Player.team_id == fixture.team_a).all()
-            
-            all_players = [(p, 1, fixture.team_a) for p in home_players] + \
-                          [(p, 0, fixture.team_h) for p in away_players]
+            all_players = [(p, 1, fixture.team_a) for p in players_by_team[fixture.team_h]] + \
+                          [(p, 0, fixture.team_h) for p in players_by_team[fixture.team_a]]
             
             for player, is_home, opponent_id in all_players:
                 # Calculate features based on history
-                stats = db.query(models.PlayerStats).join(models.Fixture).filter(
-                    models.PlayerStats.player_id == player.id
-                ).order_by(models.Fixture.event).all()
-                
-                points_history = [s.total_points for s in stats]
-                minutes_history = [s.minutes for s in stats]
+                points_history, minutes_history = history_by_pid.get(player.id, empty_history)
                 
-                avg_points_last_5 = np.mean(points_history[-5:]) if points_history else 0
+                avg_points_last_5 = np.mean(points_history[-5:]) if len(points_history) else 0
                 minutes_consistency = np.std(minutes_history[-5:]) if len(minutes_history) > 1 else 0
                 form = avg_points_last_5
-                opponent_difficulty = 3 # Default
-                
-                features = pd.DataFrame([{
-                    'avg_points_last_5': avg_points_last_5,
-                    'form': form,
-                    'opponent_difficulty': opponent_difficulty,
-                    'is_home': is_home,
-                    'minutes_consistency': minutes_consistency
-                }])
+                opponent_difficulty = team_strengths.get(opponent_id, 3)
                 
-                predicted_points = model.predict(features)[0]
-                
-                predictions.append({
+                X[len(player_rows)] = (
+                    avg_points_last_5, form, opponent_difficulty, is_home, minutes_consistency
+                )
+                player_rows.append({
                     'player_id': player.id,
                     'player_name': f"{player.first_name} {player.second_name}",
                     'team_id': player.team_id,
-                    'position': player.position,
-                    'predicted_points': float(predicted_points)
+                    'position': player.position
                 })
         
+        # Models fitted on a DataFrame expect the column names back
+        if hasattr(model, 'feature_names_in_'):
+            X = pd.DataFrame(X, columns=FEATURE_COLUMNS, copy=False)
+        predicted_points = model.predict(X)
+        predictions = [
+            {**player_row, 'predicted_points': float(points)}
+            for player_row, points in zip(player_rows, predicted_points)
+        ]
+        
         # Sort by predicted points
         predictions.sort(key=lambda x: x['predicted_points'], reverse=True)
         return predictions
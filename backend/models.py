@@ -1,8 +1,17 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, Boolean, DateTime, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
 
+# Feature columns are stored single precision (REAL/FLOAT4): the model only
+# needs ~6 significant digits, and narrower rows make the training scan cheaper
+Float32 = Float(precision=24)
+
+# ModelFeatures columns read by the training query
+TRAINING_FEATURE_COLUMNS = (
+    'avg_points_last_5', 'form', 'opponent_difficulty', 'is_home', 'minutes_consistency'
+)
+
 class Team(Base):
     __tablename__ = "teams"
 
@@ -36,6 +45,12 @@ class Fixture(Base):
 
 class PlayerStats(Base):
     __tablename__ = "player_stats"
+    __table_args__ = (
+        # One row per player per match; also the target of ON CONFLICT upserts
+        Index('uq_player_stats_player_fixture', 'player_id', 'fixture_id', unique=True),
+        # Covers the training join, which only needs the target from this table
+        Index('ix_player_stats_training', 'player_id', 'fixture_id', 'total_points'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     player_id = Column(Integer, ForeignKey("players.id"))
@@ -46,41 +61,49 @@ class PlayerStats(Base):
     total_points = Column(Integer)
     
     # Understat advanced stats
-    xG = Column(Float, nullable=True)  # Expected Goals
-    xA = Column(Float, nullable=True)  # Expected Assists
+    xG = Column(Float32, nullable=True)  # Expected Goals
+    xA = Column(Float32, nullable=True)  # Expected Assists
     shots = Column(Integer, nullable=True)  # Number of shots
     
     player = relationship("Player", back_populates="stats")
 
 class ModelFeatures(Base):
     __tablename__ = "model_features"
+    __table_args__ = (
+        Index('uq_model_features_player_fixture', 'player_id', 'fixture_id', unique=True),
+        # Covers the training read so it never touches the table rows
+        Index(
+            'ix_model_features_training', 'player_id', 'fixture_id',
+            *TRAINING_FEATURE_COLUMNS
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     player_id = Column(Integer, ForeignKey("players.id"))
     fixture_id = Column(Integer, ForeignKey("fixtures.id"))
     
     # Traditional Features
-    avg_points_last_5 = Column(Float)
-    form = Column(Float)
+    avg_points_last_5 = Column(Float32)
+    form = Column(Float32)
     opponent_difficulty = Column(Integer)
     is_home = Column(Integer)  # 1 for home, 0 for away
-    minutes_consistency = Column(Float)
+    minutes_consistency = Column(Float32)
     
     # Minutes & Playing Time Features
-    avg_minutes_last_5 = Column(Float, nullable=True)  # Average minutes played last 5 games
-    minutes_trend = Column(Float, nullable=True)  # Trend: are minutes increasing or decreasing?
-    minutes_variance = Column(Float, nullable=True)  # Variance in minutes (rotation risk)
-    games_with_minutes = Column(Float, nullable=True)  # % of games where player got >0 minutes
+    avg_minutes_last_5 = Column(Float32, nullable=True)  # Average minutes played last 5 games
+    minutes_trend = Column(Float32, nullable=True)  # Trend: are minutes increasing or decreasing?
+    minutes_variance = Column(Float32, nullable=True)  # Variance in minutes (rotation risk)
+    games_with_minutes = Column(Float32, nullable=True)  # % of games where player got >0 minutes
     
     # Understat Advanced Features
-    avg_xG_last_5 = Column(Float, nullable=True)  # Average expected goals
-    avg_xA_last_5 = Column(Float, nullable=True)  # Average expected assists
-    avg_shots_last_5 = Column(Float, nullable=True)  # Average shots on target/total
-    xG_outperformance = Column(Float, nullable=True)  # Goals - xG (finishing quality)
+    avg_xG_last_5 = Column(Float32, nullable=True)  # Average expected goals
+    avg_xA_last_5 = Column(Float32, nullable=True)  # Average expected assists
+    avg_shots_last_5 = Column(Float32, nullable=True)  # Average shots on target/total
+    xG_outperformance = Column(Float32, nullable=True)  # Goals - xG (finishing quality)
     
     # Team Context
-    team_xG = Column(Float, nullable=True)  # Team's xG in last match
-    opponent_xGA = Column(Float, nullable=True)  # Opponent's xGA (defensive weakness)
+    team_xG = Column(Float32, nullable=True)  # Team's xG in last match
+    opponent_xGA = Column(Float32, nullable=True)  # Opponent's xGA (defensive weakness)
     
     player = relationship("Player")
     fixture = relationship("Fixture")
@@ -96,3 +119,13 @@ class InjuryStatus(Base):
     updated_at = Column(DateTime, default=datetime.utcnow)
     
     player = relationship("Player", back_populates="injury_status")
+
+
+def create_missing_indexes(bind):
+    """
+    create_all skips tables that already exist, so indexes declared after a
+    database was created are added here.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
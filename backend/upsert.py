@@ -0,0 +1,38 @@
+"""
+INSERT ... ON CONFLICT helpers for bulk writes.
+Lets the database enforce uniqueness instead of a SELECT before each INSERT.
+"""
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+_DIALECT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def _insert(session, model):
+    dialect = session.get_bind().dialect.name
+    if dialect not in _DIALECT_INSERTS:
+        raise NotImplementedError(f"Upserts are not supported for dialect '{dialect}'")
+    return _DIALECT_INSERTS[dialect](model.__table__)
+
+
+def upsert_ignore(session, model, rows, pk_cols):
+    """Insert rows, skipping any that collide with an existing key in pk_cols"""
+    if not rows:
+        return
+    stmt = _insert(session, model).on_conflict_do_nothing(index_elements=pk_cols)
+    session.execute(stmt, rows)
+
+
+def upsert_update(session, model, rows, pk_cols, update_cols):
+    """Insert rows, overwriting update_cols on rows that collide on pk_cols"""
+    if not rows:
+        return
+    stmt = _insert(session, model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=pk_cols,
+        set_={col: stmt.excluded[col] for col in update_cols}
+    )
+    session.execute(stmt, rows)
@@ -1,21 +1,30 @@
+from sqlalchemy import func, literal, select, union_all
 from sqlalchemy.orm import Session
 from .database import SessionLocal
 from . import models
 
+# Label printed for each table's row count
+COUNTED_TABLES = [
+    ("Teams", models.Team),
+    ("Players", models.Player),
+    ("Fixtures", models.Fixture),
+    ("Player Stats", models.PlayerStats),
+    ("Model Features", models.ModelFeatures),
+]
+
 def verify_data():
     db = SessionLocal()
     try:
-        num_teams = db.query(models.Team).count()
-        num_players = db.query(models.Player).count()
-        num_fixtures = db.query(models.Fixture).count()
-        num_stats = db.query(models.PlayerStats).count()
-        num_features = db.query(models.ModelFeatures).count()
+        # All counts in one round-trip; each row carries its label since
+        # UNION ALL does not promise to keep the order
+        stmt = union_all(*(
+            select(literal(label).label("label"), func.count().label("count")).select_from(model)
+            for label, model in COUNTED_TABLES
+        ))
+        counts = dict(db.execute(stmt).all())
 
-        print(f"Teams: {num_teams}")
-        print(f"Players: {num_players}")
-        print(f"Fixtures: {num_fixtures}")
-        print(f"Player Stats: {num_stats}")
-        print(f"Model Features: {num_features}")
+        for label, _ in COUNTED_TABLES:
+            print(f"{label}: {counts[label]}")
 
     except Exception as e:
         print(f"An error occurred: {e}")
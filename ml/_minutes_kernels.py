@@ -0,0 +1,250 @@
+"""
+Compiled kernels behind minutes_analysis.
+
+Each kernel takes a chronological float64 array of minutes. Numba is optional;
+without it the same functions run as plain Python.
+"""
+import numpy as np
+
+from _numba_compat import njit
+
+
+@njit(cache=True)
+def _clip(value, low, high):
+    return min(high, max(low, value))
+
+
+@njit(cache=True)
+def _positive_mean(arr, start, stop):
+    total = 0.0
+    count = 0
+    for i in range(start, stop):
+        if arr[i] > 0:
+            total += arr[i]
+            count += 1
+    return total / count if count else 0.0
+
+
+@njit(cache=True)
+def minutes_trend(arr, window=5):
+    n = len(arr)
+    if n < 2:
+        return 0.0
+
+    start = max(n - window, 0)
+    all_zero = True
+    for i in range(start, n):
+        if arr[i] != 0:
+            all_zero = False
+            break
+    if all_zero:
+        return -1.0  # Not playing = negative trend
+
+    # Compare first half vs second half
+    mid = start + (n - start) // 2
+    if mid == start:
+        return 0.0
+
+    first_half_avg = _positive_mean(arr, start, mid)
+    second_half_avg = _positive_mean(arr, mid, n)
+
+    if first_half_avg == 0:
+        return 0.5 if second_half_avg > 0 else 0.0
+
+    return _clip((second_half_avg - first_half_avg) / first_half_avg, -1.0, 1.0)
+
+
+@njit(cache=True)
+def minutes_per_90(arr, matches_played):
+    if len(arr) == 0 or matches_played == 0:
+        return 0.0
+
+    potential_minutes = matches_played * 90
+    if potential_minutes == 0:
+        return 0.0
+
+    return min(1.0, arr.sum() / potential_minutes)
+
+
+@njit(cache=True)
+def playing_time_reliability(arr, window=5):
+    n = len(arr)
+    if n == 0:
+        return 0.0
+
+    start = max(n - window, 0)
+    k = n - start
+
+    # Count starts (>0 minutes) vs non-starts
+    starts = 0
+    total = 0.0
+    for i in range(start, n):
+        if arr[i] > 0:
+            starts += 1
+            total += arr[i]
+    start_rate = starts / k
+
+    # Consistency (low variance = reliable)
+    if k > 1:
+        if starts:
+            mean = total / starts
+            sq_dev = 0.0
+            for i in range(start, n):
+                if arr[i] > 0:
+                    sq_dev += (arr[i] - mean) * (arr[i] - mean)
+            variance = sq_dev / starts
+            consistency = 1.0 / (1.0 + variance / 45)  # Normalize around 45 min variance
+        else:
+            consistency = 0.0
+    else:
+        consistency = 1.0 if arr[start] > 0 else 0.0
+
+    return _clip((start_rate + consistency) / 2, 0.0, 1.0)
+
+
+@njit(cache=True)
+def rotation_risk(arr, window=5):
+    n = len(arr)
+    if n == 0:
+        return 0.5  # Unknown = medium risk
+
+    start = max(n - window, 0)
+    k = n - start
+    bench_games = 0
+    sub_games = 0
+    for i in range(start, n):
+        if arr[i] == 0:
+            bench_games += 1
+        elif 0 < arr[i] < 45:
+            sub_games += 1
+
+    # Combine: bench rate (weighted more) + partial sub appearances
+    return _clip((bench_games / k) * 0.7 + (sub_games / k) * 0.3, 0.0, 1.0)
+
+
+@njit(cache=True)
+def minutes_momentum(arr, window=3):
+    n = len(arr)
+    if n < 2:
+        return 0.0
+
+    if min(window, n) >= 2:
+        latest = arr[n - 1]
+        previous = arr[n - 2]
+
+        if previous == 0:
+            momentum = 0.5 if latest > 0 else 0.0
+        else:
+            momentum = (latest - previous) / previous
+    else:
+        momentum = 1.0 if arr[n - 1] > 0 else 0.0
+
+    return _clip(momentum, -1.0, 1.0)
+
+
+@njit(cache=True)
+def starter_probability(arr, window=5):
+    n = len(arr)
+    if n == 0:
+        return 0.5  # Unknown
+
+    start = max(n - window, 0)
+    # Starters typically play 60+ minutes
+    starts = 0
+    for i in range(start, n):
+        if arr[i] >= 60:
+            starts += 1
+
+    return _clip(starts / (n - start), 0.0, 1.0)
+
+
+@njit(cache=True)
+def all_minutes_metrics(arr, window=5, momentum_window=3):
+    """
+    Every metric above in one walk over the array, returning
+    (trend, reliability, rotation_risk, momentum, starter_probability, minutes_per_90).
+    """
+    n = len(arr)
+    if n == 0:
+        return 0.0, 0.0, 0.5, 0.0, 0.5, 0.0
+
+    start = max(n - window, 0)
+    k = n - start
+    mid = start + k // 2
+
+    total = 0.0
+    all_zero = True
+    starts = 0
+    start_total = 0.0
+    first_total = 0.0
+    first_count = 0
+    second_total = 0.0
+    second_count = 0
+    bench_games = 0
+    sub_games = 0
+    full_games = 0
+    for i in range(n):
+        m = arr[i]
+        total += m
+        if i < start:
+            continue
+        if m != 0:
+            all_zero = False
+        if m > 0:
+            starts += 1
+            start_total += m
+            if i < mid:
+                first_total += m
+                first_count += 1
+            else:
+                second_total += m
+                second_count += 1
+            if m < 45:
+                sub_games += 1
+        elif m == 0:
+            bench_games += 1
+        if m >= 60:
+            full_games += 1
+
+    # Trend: first half vs second half of the window
+    if n < 2:
+        trend = 0.0
+    elif all_zero:
+        trend = -1.0  # Not playing = negative trend
+    elif mid == start:
+        trend = 0.0
+    else:
+        first_half_avg = first_total / first_count if first_count else 0.0
+        second_half_avg = second_total / second_count if second_count else 0.0
+        if first_half_avg == 0:
+            trend = 0.5 if second_half_avg > 0 else 0.0
+        else:
+            trend = _clip((second_half_avg - first_half_avg) / first_half_avg, -1.0, 1.0)
+
+    # Reliability: start rate and consistency of the minutes played; the
+    # variance takes a second look at only the window, to match np.var
+    if k > 1:
+        if starts:
+            mean = start_total / starts
+            sq_dev = 0.0
+            for i in range(start, n):
+                if arr[i] > 0:
+                    sq_dev += (arr[i] - mean) * (arr[i] - mean)
+            consistency = 1.0 / (1.0 + (sq_dev / starts) / 45)
+        else:
+            consistency = 0.0
+    else:
+        consistency = 1.0 if arr[start] > 0 else 0.0
+    reliability = _clip((starts / k + consistency) / 2, 0.0, 1.0)
+
+    rotation = _clip((bench_games / k) * 0.7 + (sub_games / k) * 0.3, 0.0, 1.0)
+    starter = _clip(full_games / k, 0.0, 1.0)
+    momentum = minutes_momentum(arr, momentum_window)
+    per_90 = min(1.0, total / (n * 90))
+
+    return trend, reliability, rotation, momentum, starter, per_90
+
+
+def as_minutes_array(minutes_history) -> np.ndarray:
+    """Minutes list (or array) as the contiguous float64 array the kernels take."""
+    return np.ascontiguousarray(minutes_history, dtype=np.float64)
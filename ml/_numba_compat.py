@@ -0,0 +1,12 @@
+"""
+numba's njit, or a stand-in that leaves functions as plain Python when numba
+is not installed.
+"""
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
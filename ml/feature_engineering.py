@@ -2,15 +2,33 @@
 Feature engineering pipeline for model training.
 Computes features for each player-fixture combination.
 """
+from typing import NamedTuple
 import numpy as np
 import pandas as pd
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from opponent_difficulty import get_opponent_difficulty
+from backend import models
+
+
+class FeatureRow(NamedTuple):
+    """Model input for one player-fixture, in training column order."""
+    avg_points_last_5: float
+    avg_points_last_10: float
+    form: float
+    opponent_difficulty: float
+    is_home: int
+    minutes_consistency: float
+    goal_threat: float
+    injury_risk: float
+
+
+# Training feature columns, in model input order
+FEATURE_COLUMNS = list(FeatureRow._fields)
 
 
 def calculate_player_form(points_history: list, window: int = 5) -> float:
     """Calculate recent form as average points in last N matches."""
-    if not points_history:
+    if len(points_history) == 0:
         return 0.0
     return float(np.mean(points_history[-window:]))
 
@@ -24,7 +42,7 @@ def calculate_minutes_consistency(minutes_history: list, window: int = 5) -> flo
         return 0.0
     
     recent = minutes_history[-window:]
-    if not recent:
+    if len(recent) == 0:
         return 0.0
     
     # Normalize: 0 = no consistency, 1 = perfect consistency
@@ -37,8 +55,6 @@ def calculate_goal_threat(player_id: int, db: Session, window: int = 5) -> float
     Calculate goal threat (goals + assists per match).
     Higher = more dangerous in attack.
     """
-    from backend import models
-    
     stats = db.query(models.PlayerStats).filter(
         models.PlayerStats.player_id == player_id
     ).order_by(models.PlayerStats.fixture_id.desc()).limit(window).all()
@@ -50,6 +66,25 @@ def calculate_goal_threat(player_id: int, db: Session, window: int = 5) -> float
     return float(total_goal_contributions / len(stats))
 
 
+def get_goal_threat_lookup(db: Session, window: int = 5) -> dict:
+    """
+    Goal threat before every match, in one windowed query.
+    Returns {(player_id, fixture_id): average goals + assists over the
+    previous `window` matches by fixture id}, None where there are none.
+    """
+    goal_threat = func.avg(
+        models.PlayerStats.goals_scored + models.PlayerStats.assists
+    ).over(
+        partition_by=models.PlayerStats.player_id,
+        order_by=models.PlayerStats.fixture_id,
+        rows=(-window, -1)
+    )
+    rows = db.query(
+        models.PlayerStats.player_id, models.PlayerStats.fixture_id, goal_threat
+    ).all()
+    return {(player_id, fixture_id): value for player_id, fixture_id, value in rows}
+
+
 def calculate_injury_risk(minutes_history: list, window: int = 5) -> float:
     """
     Estimate injury risk based on minute drop-off.
@@ -59,7 +94,7 @@ def calculate_injury_risk(minutes_history: list, window: int = 5) -> float:
         return 0.0
     
     recent = minutes_history[-window:]
-    if not recent or recent[-1] == 0:
+    if len(recent) == 0 or recent[-1] == 0:
         return 1.0  # High risk if not playing
     
     # Check if there's a trend of decreasing minutes
@@ -74,30 +109,25 @@ def calculate_injury_risk(minutes_history: list, window: int = 5) -> float:
 
 
 def engineer_features_for_player_fixture(
-    player_id: int,
-    fixture_id: int,
-    db: Session,
+    player,
+    fixture,
     points_history: list,
-    minutes_history: list
-) -> dict:
+    minutes_history: list,
+    goal_threat: float
+) -> FeatureRow:
     """
     Compute all features for a specific player-fixture combination.
     
     Args:
-        player_id: Player identifier
-        fixture_id: Fixture identifier
-        db: Database session
-        points_history: List of total points from previous matches (in order)
-        minutes_history: List of minutes played from previous matches (in order)
+        player: Player row (needs team_id)
+        fixture: Fixture row (needs team_h, team_a)
+        points_history: Total points from previous matches (in order), list or array
+        minutes_history: Minutes played from previous matches (in order), list or array
+        goal_threat: Player's goal threat, see calculate_goal_threat
     
     Returns:
-        dict: Feature dictionary ready for model input
+        FeatureRow: Features ready for model input
     """
-    from backend import models
-    
-    fixture = db.query(models.Fixture).filter(models.Fixture.id == fixture_id).first()
-    player = db.query(models.Player).filter(models.Player.id == player_id).first()
-    
     if not fixture or not player:
         return None
     
@@ -116,18 +146,48 @@ def engineer_features_for_player_fixture(
     opponent_difficulty = 3.0  # Default value for now
     
     # Calculate all features
-    features = {
-        'avg_points_last_5': calculate_player_form(points_history, window=5),
-        'avg_points_last_10': calculate_player_form(points_history, window=10),
-        'form': calculate_player_form(points_history, window=3),
-        'opponent_difficulty': opponent_difficulty,
-        'is_home': is_home,
-        'minutes_consistency': calculate_minutes_consistency(minutes_history),
-        'goal_threat': calculate_goal_threat(player_id, db),
-        'injury_risk': calculate_injury_risk(minutes_history),
-    }
-    
-    return features
+    return FeatureRow(
+        avg_points_last_5=calculate_player_form(points_history, window=5),
+        avg_points_last_10=calculate_player_form(points_history, window=10),
+        form=calculate_player_form(points_history, window=3),
+        opponent_difficulty=opponent_difficulty,
+        is_home=is_home,
+        minutes_consistency=calculate_minutes_consistency(minutes_history),
+        goal_threat=goal_threat,
+        injury_risk=calculate_injury_risk(minutes_history),
+    )
+
+
+def _past_rolling(df: pd.DataFrame, column: str, window: int, min_periods: int = 1):
+    """Rolling window over each player's previous matches (current match excluded)."""
+    past = df.groupby('player_id')[column].shift()
+    return past.groupby(df['player_id']).rolling(window, min_periods=min_periods)
+
+
+def _past_injury_risk(df: pd.DataFrame, window: int = 5) -> np.ndarray:
+    """calculate_injury_risk for every row at once, from each player's previous matches."""
+    minutes = df['minutes'].to_numpy(dtype=np.float64)
+    idx = np.arange(len(df))
+    n_past = np.minimum(df.groupby('player_id').cumcount().to_numpy(), window)
+    start = idx - n_past
+    mid = start + n_past // 2
+    
+    # Window sums from a running total; windows never cross players since
+    # they only reach back n_past rows
+    csum = np.concatenate(([0.0], np.cumsum(minutes)))
+    has_history = n_past >= 2
+    early_avg = np.divide(csum[mid] - csum[start], n_past // 2,
+                          out=np.zeros(len(df)), where=has_history)
+    late_avg = np.divide(csum[idx] - csum[mid], n_past - n_past // 2,
+                         out=np.zeros(len(df)), where=has_history)
+    last = minutes[np.maximum(idx - 1, 0)]
+    
+    drop_ratio = np.divide(early_avg - late_avg, early_avg,
+                           out=np.zeros(len(df)), where=early_avg != 0)
+    risk = np.clip(drop_ratio, 0.0, 1.0)
+    risk[has_history & (last == 0)] = 1.0  # High risk if not playing
+    risk[~has_history] = 0.0
+    return risk
 
 
 def generate_training_dataset(db: Session) -> pd.DataFrame:
@@ -137,50 +197,55 @@ def generate_training_dataset(db: Session) -> pd.DataFrame:
     Returns:
         DataFrame with columns: all features + 'total_points' (target)
     """
-    from backend import models
-    
-    records = []
-    
-    # Get all players
-    players = db.query(models.Player).all()
-    
-    for player in players:
-        # Get all stats for this player in chronological order
-        all_stats = db.query(models.PlayerStats).join(models.Fixture).filter(
-            models.PlayerStats.player_id == player.id
-        ).order_by(models.Fixture.event).all()
-        
-        if not all_stats:
-            continue
-        
-        points_history = []
-        minutes_history = []
-        
-        # Process each match
-        for i, stat in enumerate(all_stats):
-            # Only use features from past matches (no data leakage)
-            features = engineer_features_for_player_fixture(
-                player.id,
-                stat.fixture_id,
-                db,
-                points_history,  # Past data only
-                minutes_history
-            )
-            
-            if features is None:
-                continue
-            
-            # Add target variable
-            features['total_points'] = stat.total_points
-            records.append(features)
-            
-            # Now update history for next iteration
-            points_history.append(stat.total_points)
-            minutes_history.append(stat.minutes)
-    
-    df = pd.DataFrame(records)
-    
-    # Remove rows with NaN
-    df = df.dropna()
-    
-    return df
+    goal_threat_lookup = get_goal_threat_lookup(db)
+    
+    # Fetch every stat with its fixture and player in one query, ordered so
+    # each player's matches are contiguous and chronological
+    rows = db.query(
+        models.PlayerStats.player_id,
+        models.PlayerStats.fixture_id,
+        models.PlayerStats.total_points,
+        models.PlayerStats.minutes,
+        models.PlayerStats.goals_scored,
+        models.PlayerStats.assists,
+        models.Fixture.team_h,
+        models.Player.team_id
+    ).join(
+        models.Fixture, models.PlayerStats.fixture_id == models.Fixture.id
+    ).join(
+        models.Player, models.PlayerStats.player_id == models.Player.id
+    ).order_by(models.PlayerStats.player_id, models.Fixture.event).all()
+    
+    if not rows:
+        return pd.DataFrame(columns=FEATURE_COLUMNS + ['total_points'])
+    
+    stats = pd.DataFrame(rows, columns=[
+        'player_id', 'fixture_id', 'total_points', 'minutes',
+        'goals_scored', 'assists', 'team_h', 'team_id'
+    ])
+    
+    # Every feature only uses matches before the current one (no data leakage),
+    # computed for all players at once rather than per row
+    minutes_std = _past_rolling(stats, 'minutes', 5, min_periods=2).std(ddof=0)
+    
+    # Features are written into preallocated float32 columns
+    n = len(stats)
+    out = {col: np.empty(n, dtype=np.float32) for col in FEATURE_COLUMNS}
+    out['avg_points_last_5'][:] = _past_rolling(stats, 'total_points', 5).mean().to_numpy()
+    out['avg_points_last_10'][:] = _past_rolling(stats, 'total_points', 10).mean().to_numpy()
+    out['form'][:] = _past_rolling(stats, 'total_points', 3).mean().to_numpy()
+    # Use cached opponent difficulty (simpler calculation)
+    out['opponent_difficulty'][:] = 3.0  # Default value for now
+    out['is_home'][:] = stats['team_id'].to_numpy() == stats['team_h'].to_numpy()
+    out['minutes_consistency'][:] = (1 - minutes_std.to_numpy() / 90).clip(0)  # 90 is max minutes
+    for i, key in enumerate(zip(stats['player_id'], stats['fixture_id'])):
+        out['goal_threat'][i] = goal_threat_lookup.get(key, np.nan)
+    out['injury_risk'][:] = _past_injury_risk(stats)
+    
+    # No history yet: use defaults but still create sample
+    # (better to have some data than nothing)
+    for values in out.values():
+        np.nan_to_num(values, copy=False, nan=0.0)
+    
+    out['total_points'] = stats['total_points'].to_numpy()
+    return pd.DataFrame(out, copy=False)
@@ -1,9 +1,28 @@
 """
 Minutes analysis for players - tracks playing time trends and patterns.
 """
+import threading
 import numpy as np
 import pandas as pd
 from sqlalchemy.orm import Session
+import _minutes_kernels as kernels
+from _minutes_kernels import as_minutes_array
+
+# Per-thread buffer the minutes are copied into before running the kernels,
+# so scoring every player does not allocate a new array per call
+SCRATCH_SIZE = 128
+_SCRATCH = threading.local()
+
+
+def _scratch_minutes(minutes, n: int) -> np.ndarray:
+    """Copy n minutes values into this thread's scratch buffer and return that view."""
+    buf = getattr(_SCRATCH, 'buf', None)
+    if buf is None or len(buf) < n:
+        buf = np.empty(max(n, SCRATCH_SIZE), dtype=np.float64)
+        _SCRATCH.buf = buf
+    for i, m in enumerate(minutes):
+        buf[i] = m
+    return buf[:n]
 
 
 def calculate_minutes_trend(minutes_history: list, window: int = 5) -> float:
@@ -20,26 +39,7 @@ def calculate_minutes_trend(minutes_history: list, window: int = 5) -> float:
     Returns:
         float: Trend value (-1 to 1, where 1 = increasing minutes)
     """
-    if len(minutes_history) < 2:
-        return 0.0
-    
-    recent = minutes_history[-window:]
-    if not recent or all(m == 0 for m in recent):
-        return -1.0  # Not playing = negative trend
-    
-    # Compare first half vs second half
-    mid = len(recent) // 2
-    if mid == 0:
-        return 0.0
-    
-    first_half_avg = np.mean([m for m in recent[:mid] if m > 0]) if any(m > 0 for m in recent[:mid]) else 0
-    second_half_avg = np.mean([m for m in recent[mid:] if m > 0]) if any(m > 0 for m in recent[mid:]) else 0
-    
-    if first_half_avg == 0:
-        return 0.5 if second_half_avg > 0 else 0.0
-    
-    trend = (second_half_avg - first_half_avg) / first_half_avg
-    return float(np.clip(trend, -1.0, 1.0))
+    return float(kernels.minutes_trend(as_minutes_array(minutes_history), window))
 
 
 def calculate_minutes_per_90(minutes_history: list, matches_played: int) -> float:
@@ -55,16 +55,7 @@ def calculate_minutes_per_90(minutes_history: list, matches_played: int) -> floa
     Returns:
         float: Minutes per 90 (0-1.0 where 1.0 = full matches)
     """
-    if not minutes_history or matches_played == 0:
-        return 0.0
-    
-    total_minutes = sum(minutes_history)
-    potential_minutes = matches_played * 90
-    
-    if potential_minutes == 0:
-        return 0.0
-    
-    return float(min(1.0, total_minutes / potential_minutes))
+    return float(kernels.minutes_per_90(as_minutes_array(minutes_history), matches_played))
 
 
 def calculate_playing_time_reliability(minutes_history: list, window: int = 5) -> float:
@@ -81,29 +72,7 @@ def calculate_playing_time_reliability(minutes_history: list, window: int = 5) -
     Returns:
         float: Reliability score (0-1.0)
     """
-    if not minutes_history:
-        return 0.0
-    
-    recent = minutes_history[-window:]
-    
-    # Count starts (>0 minutes) vs non-starts
-    starts = sum(1 for m in recent if m > 0)
-    start_rate = starts / len(recent) if recent else 0
-    
-    # Consistency (low variance = reliable)
-    if len(recent) > 1:
-        non_zero_minutes = [m for m in recent if m > 0]
-        if non_zero_minutes:
-            variance = np.var(non_zero_minutes)
-            consistency = 1.0 / (1.0 + variance / 45)  # Normalize around 45 min variance
-        else:
-            consistency = 0.0
-    else:
-        consistency = 1.0 if recent[0] > 0 else 0.0
-    
-    # Average of start rate and consistency
-    reliability = (start_rate + consistency) / 2
-    return float(np.clip(reliability, 0.0, 1.0))
+    return float(kernels.playing_time_reliability(as_minutes_array(minutes_history), window))
 
 
 def calculate_rotation_risk(minutes_history: list, window: int = 5) -> float:
@@ -120,22 +89,7 @@ def calculate_rotation_risk(minutes_history: list, window: int = 5) -> float:
     Returns:
         float: Risk score (0-1.0, where 1.0 = high rotation risk)
     """
-    if not minutes_history:
-        return 0.5  # Unknown = medium risk
-    
-    recent = minutes_history[-window:]
-    
-    # Check for bench appearances (0 minutes)
-    bench_games = sum(1 for m in recent if m == 0)
-    bench_rate = bench_games / len(recent) if recent else 0
-    
-    # Check for reduced minutes (sub appearances)
-    sub_games = sum(1 for m in recent if 0 < m < 45)
-    sub_rate = sub_games / len(recent) if recent else 0
-    
-    # Combine: bench rate (weighted more) + partial sub appearances
-    rotation_risk = (bench_rate * 0.7) + (sub_rate * 0.3)
-    return float(np.clip(rotation_risk, 0.0, 1.0))
+    return float(kernels.rotation_risk(as_minutes_array(minutes_history), window))
 
 
 def calculate_minutes_momentum(minutes_history: list, window: int = 3) -> float:
@@ -149,26 +103,7 @@ def calculate_minutes_momentum(minutes_history: list, window: int = 3) -> float:
     Returns:
         float: Momentum score (-1 to 1)
     """
-    if len(minutes_history) < 2:
-        return 0.0
-    
-    recent = minutes_history[-window:]
-    if not recent:
-        return 0.0
-    
-    # Check if player is getting more minutes recently
-    if len(recent) >= 2:
-        latest = recent[-1]
-        previous = recent[-2]
-        
-        if previous == 0:
-            momentum = 0.5 if latest > 0 else 0.0
-        else:
-            momentum = (latest - previous) / previous
-    else:
-        momentum = 1.0 if recent[0] > 0 else 0.0
-    
-    return float(np.clip(momentum, -1.0, 1.0))
+    return float(kernels.minutes_momentum(as_minutes_array(minutes_history), window))
 
 
 def calculate_starter_probability(minutes_history: list, window: int = 5) -> float:
@@ -182,16 +117,7 @@ def calculate_starter_probability(minutes_history: list, window: int = 5) -> flo
     Returns:
         float: Start probability (0-1.0)
     """
-    if not minutes_history:
-        return 0.5  # Unknown
-    
-    recent = minutes_history[-window:]
-    
-    # Starters typically play 60+ minutes
-    starts = sum(1 for m in recent if m >= 60)
-    start_prob = starts / len(recent) if recent else 0
-    
-    return float(np.clip(start_prob, 0.0, 1.0))
+    return float(kernels.starter_probability(as_minutes_array(minutes_history), window))
 
 
 def analyze_player_minutes(player_id: int, db: Session) -> dict:
@@ -227,18 +153,20 @@ def analyze_player_minutes(player_id: int, db: Session) -> dict:
             'recent_minutes': 0
         }
     
-    minutes_history = [s.minutes for s in stats]
+    minutes = _scratch_minutes((s.minutes for s in stats), len(stats))
+    trend, reliability, rotation_risk, momentum, starter_probability, minutes_per_90 = \
+        kernels.all_minutes_metrics(minutes)
     
     return {
-        'minutes_trend': calculate_minutes_trend(minutes_history),
-        'minutes_per_90': calculate_minutes_per_90(minutes_history, len(stats)),
-        'playing_time_reliability': calculate_playing_time_reliability(minutes_history),
-        'rotation_risk': calculate_rotation_risk(minutes_history),
-        'minutes_momentum': calculate_minutes_momentum(minutes_history),
-        'starter_probability': calculate_starter_probability(minutes_history),
-        'total_minutes': sum(minutes_history),
-        'average_minutes': float(np.mean(minutes_history)) if minutes_history else 0.0,
-        'recent_minutes': minutes_history[-1] if minutes_history else 0
+        'minutes_trend': float(trend),
+        'minutes_per_90': float(minutes_per_90),
+        'playing_time_reliability': float(reliability),
+        'rotation_risk': float(rotation_risk),
+        'minutes_momentum': float(momentum),
+        'starter_probability': float(starter_probability),
+        'total_minutes': int(minutes.sum()),
+        'average_minutes': float(np.mean(minutes)),
+        'recent_minutes': stats[-1].minutes
     }
 
 
@@ -261,10 +189,14 @@ def get_minutes_features_for_prediction(minutes_history: list) -> dict:
             'recent_avg_minutes': 0.0
         }
     
+    minutes = _scratch_minutes(minutes_history, len(minutes_history))
+    trend, _, rotation_risk, _, starter_probability, minutes_per_90 = \
+        kernels.all_minutes_metrics(minutes)
+    
     return {
-        'minutes_trend': calculate_minutes_trend(minutes_history),
-        'minutes_per_90': calculate_minutes_per_90(minutes_history, len(minutes_history)),
-        'rotation_risk': calculate_rotation_risk(minutes_history),
-        'starter_probability': calculate_starter_probability(minutes_history),
-        'recent_avg_minutes': float(np.mean(minutes_history[-5:] if len(minutes_history) >= 5 else minutes_history))
+        'minutes_trend': float(trend),
+        'minutes_per_90': float(minutes_per_90),
+        'rotation_risk': float(rotation_risk),
+        'starter_probability': float(starter_probability),
+        'recent_avg_minutes': float(np.mean(minutes[-5:]))
     }
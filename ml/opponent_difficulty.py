@@ -8,6 +8,27 @@ import pandas as pd
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
+from _numba_compat import njit
+
+# 20 teams in FPL, with ids 1-20
+NUM_TEAMS = 20
+# Points conceded per match that maps to one step down the 1-5 scale
+MAX_CONCEDED = 10
+
+
+@njit(cache=True)
+def _clamp_ratings(home_avgs, away_avgs, overall_avgs, max_conceded):
+    """Points conceded per match -> 1-5 ratings (5 = hardest defense), per context."""
+    n = len(home_avgs)
+    home = np.empty(n)
+    away = np.empty(n)
+    overall = np.empty(n)
+    for i in range(n):
+        home[i] = min(5.0, max(1.0, 5.0 - home_avgs[i] / max_conceded))
+        away[i] = min(5.0, max(1.0, 5.0 - away_avgs[i] / max_conceded))
+        overall[i] = min(5.0, max(1.0, 5.0 - overall_avgs[i] / max_conceded))
+    return home, away, overall
+
 
 def calculate_team_difficulty_rating(db: Session):
     """
@@ -18,75 +39,104 @@ def calculate_team_difficulty_rating(db: Session):
     """
     from backend import models
     
-    # Fetch all fixtures with player stats
-    fixtures = db.query(models.Fixture).all()
-    team_stats = {}
-    
-    for team_id in range(1, 21):  # 20 teams in FPL
-        team_stats[team_id] = {'home': [], 'away': []}
-    
-    for fixture in fixtures:
-        # Get all player stats for this fixture
-        home_stats = db.query(models.PlayerStats).join(
-            models.Player,
-            models.PlayerStats.player_id == models.Player.id
-        ).filter(
-            models.Player.team_id == fixture.team_h,
-            models.PlayerStats.fixture_id == fixture.id
-        ).all()
-        
-        away_stats = db.query(models.PlayerStats).join(
+    # Fetch all fixtures, and the points each team's players scored in each
+    # fixture, summed in the database in one query
+    fixtures = db.query(
+        models.Fixture.id, models.Fixture.team_h, models.Fixture.team_a
+    ).all()
+    points_by_fixture_team = {
+        (fixture_id, team_id): points
+        for fixture_id, team_id, points in db.query(
+            models.PlayerStats.fixture_id,
+            models.Player.team_id,
+            func.sum(models.PlayerStats.total_points)
+        ).join(
             models.Player,
             models.PlayerStats.player_id == models.Player.id
-        ).filter(
-            models.Player.team_id == fixture.team_a,
-            models.PlayerStats.fixture_id == fixture.id
-        ).all()
-        
+        ).group_by(models.PlayerStats.fixture_id, models.Player.team_id)
+    }
+    
+    # One (team, context, conceded) entry per side of each fixture, where
+    # context 0 = home and 1 = away
+    n = len(fixtures)
+    team_ids = np.empty(2 * n, dtype=np.int64)
+    conceded = np.empty(2 * n)
+    for i, fixture in enumerate(fixtures):
         # Aggregate points conceded (lower is better defense)
-        home_points = sum([s.total_points for s in away_stats]) if away_stats else 0
-        away_points = sum([s.total_points for s in home_stats]) if home_stats else 0
-        
-        # Store for calculation
-        if fixture.team_a in team_stats:
-            team_stats[fixture.team_a]['home'].append(home_points)
-        if fixture.team_h in team_stats:
-            team_stats[fixture.team_h]['away'].append(away_points)
+        team_ids[i] = fixture.team_a
+        conceded[i] = points_by_fixture_team.get((fixture.id, fixture.team_a), 0)
+        team_ids[n + i] = fixture.team_h
+        conceded[n + i] = points_by_fixture_team.get((fixture.id, fixture.team_h), 0)
+    contexts = np.repeat([0, 1], n)
+    
+    valid = (team_ids >= 1) & (team_ids <= NUM_TEAMS)
+    keys = team_ids[valid] * 2 + contexts[valid]
+    size = (NUM_TEAMS + 1) * 2
     
-    # Convert to ratings (invert: more conceded = harder to score against)
-    difficulty_map = {}
-    for team_id, context_stats in team_stats.items():
-        home_avg = np.mean(context_stats['home']) if context_stats['home'] else 0
-        away_avg = np.mean(context_stats['away']) if context_stats['away'] else 0
-        overall_avg = np.mean(context_stats['home'] + context_stats['away']) if (context_stats['home'] or context_stats['away']) else 0
-        
-        # Normalize to 1-5 scale (5 = hardest defense)
-        max_conceded = 10
-        home_difficulty = min(5, max(1, 5 - (home_avg / max_conceded)))
-        away_difficulty = min(5, max(1, 5 - (away_avg / max_conceded)))
-        overall_difficulty = min(5, max(1, 5 - (overall_avg / max_conceded)))
-        
-        difficulty_map[team_id] = {
-            'home': round(home_difficulty, 2),
-            'away': round(away_difficulty, 2),
-            'overall': round(overall_difficulty, 2)
-        }
+    # Per-(team, context) sums and counts, one row per team id
+    sums = np.bincount(keys, weights=conceded[valid], minlength=size).reshape(-1, 2)
+    counts = np.bincount(keys, minlength=size).reshape(-1, 2)
+    avgs = np.divide(sums, counts, out=np.zeros(sums.shape), where=counts > 0)
+    overall_counts = counts.sum(axis=1)
+    overall_avg = np.divide(sums.sum(axis=1), overall_counts,
+                            out=np.zeros(len(sums)), where=overall_counts > 0)
     
+    # Convert to ratings (invert: more conceded = harder to score against),
+    # normalized to 1-5 scale (5 = hardest defense)
+    home_difficulty, away_difficulty, overall_difficulty = (
+        np.round(ratings, 2) for ratings in _clamp_ratings(
+            np.ascontiguousarray(avgs[:, 0]), np.ascontiguousarray(avgs[:, 1]),
+            overall_avg, float(MAX_CONCEDED)
+        )
+    )
+    
+    difficulty_map = {
+        team_id: {'home': home, 'away': away, 'overall': overall}
+        for team_id, home, away, overall in zip(
+            range(1, NUM_TEAMS + 1),
+            home_difficulty[1:].tolist(),
+            away_difficulty[1:].tolist(),
+            overall_difficulty[1:].tolist()
+        )
+    }
+    
+    return difficulty_map
+
+
+def get_team_difficulty_map(db: Session):
+    """
+    calculate_team_difficulty_rating, memoized on the session.
+    
+    The map is computed once per session and kept in db.info; call
+    clear_team_difficulty_cache after changing fixtures or player stats
+    through the same session.
+    """
+    difficulty_map = db.info.get('team_difficulty')
+    if difficulty_map is None:
+        difficulty_map = db.info['team_difficulty'] = calculate_team_difficulty_rating(db)
     return difficulty_map
 
 
-def get_opponent_difficulty(db: Session, opponent_id: int, is_home: bool):
+def clear_team_difficulty_cache(db: Session):
+    """Forget the session's memoized difficulty map so the next lookup recomputes it"""
+    db.info.pop('team_difficulty', None)
+
+
+def get_opponent_difficulty(db: Session, opponent_id: int, is_home: bool, difficulty_map: dict = None):
     """
     Get opponent difficulty rating considering home/away context.
     
     Args:
         opponent_id: Team ID of the opponent
         is_home: Whether the player's team is playing at home
+        difficulty_map: Precomputed calculate_team_difficulty_rating result;
+            looked up from the session cache when omitted
     
     Returns:
         float: Difficulty rating (1-5, where 5 is hardest)
     """
-    difficulty_map = calculate_team_difficulty_rating(db)
+    if difficulty_map is None:
+        difficulty_map = get_team_difficulty_map(db)
     
     if opponent_id not in difficulty_map:
         return 3.0  # Default if not found
@@ -3,12 +3,20 @@ Inference pipeline for making predictions on future matches.
 """
 import os
 import sys
+import functools
+import heapq
+import itertools
 import joblib
 import pandas as pd
 import numpy as np
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from backend.database import SessionLocal
@@ -18,21 +26,50 @@ from backend import models
 import os
 current_dir = os.path.dirname(__file__)
 sys.path.insert(0, current_dir)
-from feature_engineering import engineer_features_for_player_fixture
+from feature_engineering import engineer_features_for_player_fixture, FeatureRow
+
+# Output labels for Player.position and is_home
+POSITION_MAP = {1: 'GKP', 2: 'DEF', 3: 'MID', 4: 'FWD'}
+HA = ('AWAY', 'HOME')
+# Most past matches any feature looks back over (avg_points_last_10)
+HISTORY_WINDOW = 10
+# Matches goal threat is averaged over, as in calculate_goal_threat
+GOAL_THREAT_WINDOW = 5
+
+
+class OnnxModel:
+    """model.onnx run through onnxruntime, with the sklearn predict() interface"""
+    
+    def __init__(self, path: str):
+        self.session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+    
+    def predict(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        return self.session.run(None, {self.input_name: X})[0].ravel()
+
 
+# The model is loaded once per process and reused by every prediction.
+# Call clear_model_cache() after retraining to pick up the new files.
 
+@functools.lru_cache(maxsize=4)
 def load_model_and_features(model_dir: str = None):
     """Load trained model and feature names."""
     if model_dir is None:
         model_dir = os.path.dirname(__file__)
     
     model_path = os.path.join(model_dir, 'model.joblib')
+    onnx_path = os.path.join(model_dir, 'model.onnx')
     features_path = os.path.join(model_dir, 'features.txt')
     
-    if not os.path.exists(model_path):
+    # Prefer the ONNX export written by train.py when onnxruntime is installed
+    if onnxruntime is not None and os.path.exists(onnx_path):
+        model = OnnxModel(onnx_path)
+    elif not os.path.exists(model_path):
         raise FileNotFoundError(f"Model not found at {model_path}")
-    
-    model = joblib.load(model_path)
+    else:
+        # Reads both plain pickles and joblib files; joblib arrays are memory-mapped
+        model = joblib.load(model_path, mmap_mode='r')
     
     if os.path.exists(features_path):
         with open(features_path, 'r') as f:
@@ -43,6 +80,11 @@ def load_model_and_features(model_dir: str = None):
     return model, features
 
 
+def clear_model_cache():
+    """Forget the cached model and feature names so the next call reloads them"""
+    load_model_and_features.cache_clear()
+
+
 def predict_gameweek(db: Session, gameweek: int = None, top_n: int = 20, include_injured: bool = False):
     """
     Predict player points for a specific gameweek (or next upcoming).
@@ -75,29 +117,100 @@ def predict_gameweek(db: Session, gameweek: int = None, top_n: int = 20, include
             print(f"No fixtures found for gameweek {gameweek}")
             return [], []
         
+        # Load everything the loop needs up front, keyed for dict lookups
+        team_ids = {f.team_h for f in fixtures} | {f.team_a for f in fixtures}
+        teams_by_id = {t.id: t for t in db.query(models.Team).all()}
+        
+        # Players of those teams, each with its injury status (None if it has
+        # none) from the same query
+        players_by_team = {team_id: [] for team_id in team_ids}
+        injuries_by_player = {}
+        for player, injury in db.query(models.Player, models.InjuryStatus).outerjoin(
+            models.InjuryStatus, models.InjuryStatus.player_id == models.Player.id
+        ).filter(models.Player.team_id.in_(team_ids)).all():
+            players_by_team[player.team_id].append(player)
+            injuries_by_player[player.id] = injury
+        
+        player_ids = [p.id for ps in players_by_team.values() for p in ps]
+        
+        # The features only look at each player's last HISTORY_WINDOW past
+        # matches, so rank them in the database and fetch just those, per
+        # player in event order
+        ranked = db.query(
+            models.PlayerStats.player_id,
+            models.PlayerStats.total_points,
+            models.PlayerStats.minutes,
+            func.row_number().over(
+                partition_by=models.PlayerStats.player_id,
+                order_by=(models.Fixture.event.desc(), models.PlayerStats.id.desc())
+            ).label('recency')
+        ).join(models.Fixture).filter(
+            models.PlayerStats.player_id.in_(player_ids),
+            models.Fixture.event < gameweek  # Only past matches
+        ).subquery()
+        recent_rows = db.query(
+            ranked.c.player_id, ranked.c.total_points, ranked.c.minutes
+        ).filter(
+            ranked.c.recency <= HISTORY_WINDOW
+        ).order_by(ranked.c.player_id, ranked.c.recency.desc()).all()
+        
+        # Each player's history doesn't depend on the fixture, so build it once:
+        # player_id -> (points, minutes) of past matches
+        history_by_player = {}
+        for player_id, group in itertools.groupby(recent_rows, key=lambda r: r.player_id):
+            group = list(group)
+            history_by_player[player_id] = (
+                np.asarray([r.total_points for r in group], dtype=np.float32),
+                np.asarray([r.minutes for r in group], dtype=np.float32)
+            )
+        empty_history = (np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32))
+        
+        # Goal threat (see calculate_goal_threat) averaged in the database over
+        # each player's latest matches by fixture id
+        ranked = db.query(
+            models.PlayerStats.player_id,
+            (models.PlayerStats.goals_scored + models.PlayerStats.assists).label('contributions'),
+            func.row_number().over(
+                partition_by=models.PlayerStats.player_id,
+                order_by=models.PlayerStats.fixture_id.desc()
+            ).label('recency')
+        ).filter(models.PlayerStats.player_id.in_(player_ids)).subquery()
+        goal_threat_by_player = dict(db.query(
+            ranked.c.player_id, func.avg(ranked.c.contributions)
+        ).filter(
+            ranked.c.recency <= GOAL_THREAT_WINDOW
+        ).group_by(ranked.c.player_id).all())
+        
+        # Features go straight into a float32 matrix in model column order (as
+        # in features.txt), sized for every player who could be predicted
+        columns = feature_names or list(FeatureRow._fields)
+        column_index = [FeatureRow._fields.index(name) for name in columns]
+        max_rows = sum(len(players_by_team[f.team_h]) + len(players_by_team[f.team_a]) for f in fixtures)
+        X = np.empty((max_rows, len(columns)), dtype=np.float32)
+        
         predictions = []
         injured_players = []
         
         for fixture in fixtures:
             # Get all players from both teams
-            home_players = db.query(models.Player).filter(
-                models.Player.team_id == fixture.team_h
-            ).all()
-            away_players = db.query(models.Player).filter(
-                models.Player.team_id == fixture.team_a
-            ).all()
+            home_players = players_by_team[fixture.team_h]
+            away_players = players_by_team[fixture.team_a]
+            
+            # Get team info
+            home_team = teams_by_id.get(fixture.team_h)
+            away_team = teams_by_id.get(fixture.team_a)
+            home_name = home_team.short_name if home_team else 'UNK'
+            away_name = away_team.short_name if away_team else 'UNK'
             
             all_fixture_players = [
-                (p, 1, fixture.team_a, fixture) for p in home_players
+                (p, 1, home_name, away_name) for p in home_players
             ] + [
-                (p, 0, fixture.team_h, fixture) for p in away_players
+                (p, 0, away_name, home_name) for p in away_players
             ]
             
-            for player, is_home, opponent_id, fixture in all_fixture_players:
+            for player, is_home, team_name, opponent_name in all_fixture_players:
                 # Check injury status
-                injury = db.query(models.InjuryStatus).filter(
-                    models.InjuryStatus.player_id == player.id
-                ).first()
+                injury = injuries_by_player.get(player.id)
                 
                 if injury and injury.is_injured:
                     if not include_injured:
@@ -109,69 +222,51 @@ def predict_gameweek(db: Session, gameweek: int = None, top_n: int = 20, include
                         })
                         continue
                 # Get player's historical stats
-                historical_stats = db.query(models.PlayerStats).join(
-                    models.Fixture
-                ).filter(
-                    models.PlayerStats.player_id == player.id,
-                    models.Fixture.event < gameweek  # Only past matches
-                ).order_by(models.Fixture.event).all()
-                
-                points_history = [s.total_points for s in historical_stats]
-                minutes_history = [s.minutes for s in historical_stats]
+                points_history, minutes_history = history_by_player.get(player.id, empty_history)
+                goal_threat = goal_threat_by_player.get(player.id, 0.0)
                 
                 # Engineer features
                 features = engineer_features_for_player_fixture(
-                    player.id,
-                    fixture.id,
-                    db,
+                    player,
+                    fixture,
                     points_history,
-                    minutes_history
+                    minutes_history,
+                    goal_threat
                 )
                 
                 if features is None:
                     continue
                 
-                # Prepare feature vector
-                feature_dict = {k: v for k, v in features.items()}
-                
-                # Ensure features are in correct order
-                if feature_names:
-                    X = pd.DataFrame([feature_dict])[feature_names]
-                else:
-                    X = pd.DataFrame([feature_dict])
-                
-                # Make prediction
-                predicted_points = float(model.predict(X)[0])
-                
-                # Ensure non-negative predictions
-                predicted_points = max(0, predicted_points)
-                
-                # Get team info
-                team = db.query(models.Team).filter(
-                    models.Team.id == player.team_id
-                ).first()
-                opponent = db.query(models.Team).filter(
-                    models.Team.id == opponent_id
-                ).first()
-                
-                position_map = {1: 'GKP', 2: 'DEF', 3: 'MID', 4: 'FWD'}
-                
+                # Scored below in one batch, once every player's features are in
+                X[len(predictions)] = [features[i] for i in column_index]
                 predictions.append({
                     'player_id': player.id,
                     'player_name': f"{player.first_name} {player.second_name}",
-                    'team': team.short_name if team else 'UNK',
-                    'opponent': opponent.short_name if opponent else 'UNK',
-                    'position': position_map.get(player.position, 'UNK'),
-                    'is_home': 'HOME' if is_home else 'AWAY',
-                    'predicted_points': predicted_points,
-                    'avg_last_5': round(np.mean(points_history[-5:]), 2) if points_history else 0,
+                    'team': team_name,
+                    'opponent': opponent_name,
+                    'position': POSITION_MAP.get(player.position, 'UNK'),
+                    'is_home': HA[is_home],
+                    'predicted_points': None,
+                    'avg_last_5': round(float(np.mean(points_history[-5:])), 2) if len(points_history) else 0,
                     'injury_status': None  # No injury
                 })
         
-        # Sort by predicted points
-        predictions.sort(key=lambda x: x['predicted_points'], reverse=True)
+        if predictions:
+            # One predict call for the whole gameweek
+            X = X[:len(predictions)]
+            # Models fitted on a DataFrame expect the column names back
+            if hasattr(model, 'feature_names_in_'):
+                X = pd.DataFrame(X, columns=columns, copy=False)
+            
+            # Ensure non-negative predictions
+            predicted_points = np.clip(model.predict(X), 0, None)
+            for prediction, points in zip(predictions, predicted_points.tolist()):
+                prediction['predicted_points'] = points
+        
+        # Top N by predicted points, without sorting the rest
+        top_predictions = heapq.nlargest(top_n, predictions, key=lambda x: x['predicted_points'])
         
-        return predictions[:top_n], injured_players
+        return top_predictions, injured_players
     
     except Exception as e:
         print(f"Error during prediction: {e}")
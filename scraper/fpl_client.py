@@ -1,5 +1,7 @@
-import requests
+import asyncio
 import logging
+import aiohttp
+import requests
 
 class FPLClient:
     BASE_URL = "https://fantasy.premierleague.com/api"
@@ -37,3 +39,86 @@ class FPLClient:
         response = self.session.get(url)
         response.raise_for_status()
         return response.json()
+
+
+class AsyncFPLClient:
+    """asyncio version of FPLClient for fetching many endpoints concurrently"""
+    BASE_URL = FPLClient.BASE_URL
+    # Requests in flight at once, and pooled connections to the API
+    MAX_CONCURRENCY = 16
+    CONNECTION_LIMIT = 20
+    # Attempts for rate-limited (429) or server-error responses
+    MAX_RETRIES = 3
+
+    def __init__(self):
+        self.session = None
+        self.semaphore = asyncio.Semaphore(self.MAX_CONCURRENCY)
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.CONNECTION_LIMIT),
+            headers={
+                "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36"
+            }
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def _request(self, url, headers=None):
+        """GET url as (json, validators); json is None on 304 Not Modified"""
+        async with self.semaphore:
+            for attempt in range(self.MAX_RETRIES):
+                async with self.session.get(url, headers=headers) as response:
+                    if response.status == 429 or response.status >= 500:
+                        if attempt < self.MAX_RETRIES - 1:
+                            logging.warning(f"{url} returned {response.status}, retrying")
+                            await asyncio.sleep(2 ** attempt)
+                            continue
+                    validators = {
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified')
+                    }
+                    if response.status == 304:
+                        return None, validators
+                    response.raise_for_status()
+                    return await response.json(), validators
+
+    async def _get_json(self, url):
+        data, _ = await self._request(url)
+        return data
+
+    async def get_bootstrap_static(self):
+        """Fetches general data (players, teams, events, etc.)"""
+        return await self._get_json(f"{self.BASE_URL}/bootstrap-static/")
+
+    async def get_fixtures(self):
+        """Fetches all fixtures"""
+        return await self._get_json(f"{self.BASE_URL}/fixtures/")
+
+    async def get_player_summary(self, player_id):
+        """Fetches detailed data for a specific player"""
+        return await self._get_json(f"{self.BASE_URL}/element-summary/{player_id}/")
+
+    async def get_team_stats(self, team_id):
+        """Fetches detailed stats for a team"""
+        return await self._get_json(f"{self.BASE_URL}/teams/{team_id}/")
+
+    async def get_player_summary_if_changed(self, player_id, validators=None):
+        """
+        Conditional get_player_summary: `validators` are the ones returned by an
+        earlier call. Returns (data, validators), with data None if unchanged since.
+        """
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        data, new_validators = await self._request(
+            f"{self.BASE_URL}/element-summary/{player_id}/", headers
+        )
+        if data is None:
+            return None, validators
+        return data, new_validators
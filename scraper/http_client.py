@@ -0,0 +1,26 @@
+"""
+Shared aiohttp session for the scrapers, so connections are pooled and
+kept alive across calls instead of reconnecting for each one.
+"""
+import aiohttp
+
+_session = None
+
+
+def get_session():
+    """Return the shared ClientSession, creating it on first use (call from a running event loop)"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, limit_per_host=10, enable_cleanup_closed=True),
+            timeout=aiohttp.ClientTimeout(total=60, connect=10)
+        )
+    return _session
+
+
+async def close_session():
+    """Close the shared session; call at shutdown, before the event loop ends"""
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
@@ -1,9 +1,30 @@
 import os
 import json
+import dataclasses
 import logging
 import asyncio
-from fpl_client import FPLClient
+from understat import Understat
+from fpl_client import AsyncFPLClient
 from understat_scraper import UnderstatScraper
+from http_client import close_session, get_session
+
+# orjson is optional; it serializes the scraped files much faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# zstandard is optional; with it per-player and per-team files are stored compressed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# uvloop is optional (not available on Windows); it runs the event loop faster than asyncio's own
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,43 +32,58 @@ logger = logging.getLogger(__name__)
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'raw')
 
-def save_json(data, filename):
+# ETag/Last-Modified of each saved player summary, for conditional re-fetches
+VALIDATORS_FILE = 'http_validators.json'
+ZSTD_LEVEL = 3
+
+def _to_json(obj):
+    # json can't serialize dataclasses (the Understat records) itself; orjson can
+    if dataclasses.is_dataclass(obj):
+        return {f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)}
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def save_json(data, filename, compress=False):
+    """Save data under DATA_DIR; with compress, as filename + '.zst' when zstandard is installed"""
     os.makedirs(DATA_DIR, exist_ok=True)
     filepath = os.path.join(DATA_DIR, filename)
-    with open(filepath, 'w') as f:
-        json.dump(data, f, indent=4)
+    if compress and zstandard is not None:
+        # Nobody reads these by hand, so skip the indentation
+        if orjson is not None:
+            payload = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        else:
+            payload = json.dumps(data, default=_to_json).encode()
+        stale_path, filepath = filepath, filepath + '.zst'
+        with open(filepath, 'wb') as f:
+            f.write(zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload))
+    else:
+        stale_path = filepath + '.zst'
+        if orjson is not None:
+            with open(filepath, 'wb') as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            with open(filepath, 'w') as f:
+                json.dump(data, f, indent=2, default=_to_json)
+    # The other format of the same file would now be out of date
+    if os.path.exists(stale_path):
+        os.remove(stale_path)
     logger.info(f"Saved data to {filepath}")
 
+def raw_file_exists(filename):
+    """Whether filename was saved, in either plain or compressed form"""
+    filepath = os.path.join(DATA_DIR, filename)
+    return os.path.exists(filepath) or os.path.exists(filepath + '.zst')
+
+def load_validators():
+    filepath = os.path.join(DATA_DIR, VALIDATORS_FILE)
+    if not os.path.exists(filepath):
+        return {}
+    with open(filepath, 'rb') as f:
+        return json.load(f)
+
 def main():
-    client = FPLClient()
-
-    logger.info("Fetching bootstrap-static data...")
-    bootstrap_data = client.get_bootstrap_static()
-    save_json(bootstrap_data, 'bootstrap_static.json')
-
-    logger.info("Fetching fixtures...")
-    fixtures_data = client.get_fixtures()
-    save_json(fixtures_data, 'fixtures.json')
-
-    logger.info("Fetching team stats...")
-    teams = bootstrap_data.get('teams', [])
-    for team in teams:
-        team_id = team['id']
-        try:
-            team_stats = client.get_team_stats(team_id)
-            save_json(team_stats, f'team_{team_id}.json')
-        except Exception as e:
-            logger.error(f"Failed to fetch stats for team {team_id}: {e}")
-
-    logger.info("Fetching player summaries...")
-    players = bootstrap_data.get('elements', [])
-    for player in players:
-        player_id = player['id']
-        try:
-            player_summary = client.get_player_summary(player_id)
-            save_json(player_summary, f'player_{player_id}.json')
-        except Exception as e:
-            logger.error(f"Failed to fetch summary for player {player_id}: {e}")
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    asyncio.run(scrape_fpl_data())
 
     # Scrape Understat xG data
     logger.info("Fetching Understat xG data...")
@@ -58,18 +94,58 @@ def main():
 
     logger.info("Scraping completed successfully.")
 
+async def scrape_fpl_data():
+    """Fetch FPL data; per-team and per-player requests run concurrently"""
+    async with AsyncFPLClient() as client:
+        logger.info("Fetching bootstrap-static data and fixtures...")
+        bootstrap_data, fixtures_data = await asyncio.gather(
+            client.get_bootstrap_static(), client.get_fixtures()
+        )
+        save_json(bootstrap_data, 'bootstrap_static.json')
+        save_json(fixtures_data, 'fixtures.json')
+
+        async def fetch_team(team_id):
+            try:
+                team_stats = await client.get_team_stats(team_id)
+                save_json(team_stats, f'team_{team_id}.json', compress=True)
+            except Exception as e:
+                logger.error(f"Failed to fetch stats for team {team_id}: {e}")
+
+        # Player summaries already on disk are only downloaded again if changed
+        validators = load_validators()
+
+        async def fetch_player(player_id):
+            filename = f'player_{player_id}.json'
+            try:
+                player_summary, validators[filename] = await client.get_player_summary_if_changed(
+                    player_id, validators.get(filename) if raw_file_exists(filename) else None
+                )
+                if player_summary is not None:
+                    save_json(player_summary, filename, compress=True)
+            except Exception as e:
+                logger.error(f"Failed to fetch summary for player {player_id}: {e}")
+
+        logger.info("Fetching team stats...")
+        teams = bootstrap_data.get('teams', [])
+        await asyncio.gather(*(fetch_team(team['id']) for team in teams))
+
+        logger.info("Fetching player summaries...")
+        players = bootstrap_data.get('elements', [])
+        await asyncio.gather(*(fetch_player(player['id']) for player in players))
+        save_json(validators, VALIDATORS_FILE)
+
 async def scrape_understat_data():
     """Fetch xG, xA, and minutes data from Understat"""
-    scraper = UnderstatScraper()
+    # One Understat client on the shared session serves every request below
+    scraper = UnderstatScraper(understat=Understat(get_session()))
     
-    # Get player stats for the season
-    logger.info("Fetching player shot map and stats from Understat...")
-    player_stats = await scraper.get_player_stats()
+    # Player shot maps and team stats for the season, fetched concurrently
+    logger.info("Fetching player shot map and team stats from Understat...")
+    try:
+        player_stats, team_stats = await scraper.fetch_all()
+    finally:
+        await close_session()
     save_json(player_stats, 'understat_player_stats.json')
-    
-    # Get team stats
-    logger.info("Fetching team stats from Understat...")
-    team_stats = await scraper.get_team_stats()
     save_json(team_stats, 'understat_team_stats.json')
 
 if __name__ == "__main__":
@@ -3,145 +3,455 @@ Understat scraper using official understat library.
 Fetches xG, xA, minutes, and advanced stats for players and teams.
 """
 
+import asyncio
+import itertools
+import json
 import logging
+import os
+import random
+import sys
+import time
+import aiohttp
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
 from understat import Understat
+import understat.understat as understat_api
+from http_client import get_session
+
+# numba's njit (or its plain-Python stand-in) is shared with the ml kernels
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ml._numba_compat import njit
+
+# orjson is optional; it decodes Understat's large shot payloads much faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# Seconds fetched season stats are reused for; they only change on match days
+CACHE_TTL = 3600
+# League the stats are fetched for
+LEAGUE = "epl"
+# Understat requests in flight at once while fanning out per team and player
+MAX_CONCURRENCY = 8
+# Attempts per Understat request for connection errors, timeouts and 429/5xx responses
+MAX_RETRIES = 5
+# Backoff before retry n is random up to min(MAX_BACKOFF, BACKOFF_BASE * 2**n) seconds
+BACKOFF_BASE = 0.5
+MAX_BACKOFF = 30
+
+# Value used for each shot field the Understat data leaves out
+SHOT_DEFAULTS = {
+    'player_name': '',
+    'team_name': '',
+    'position': '',
+    'xG': 0,
+    'xA': 0,
+    'result': '',
+    'minute': 0,
+    'match_id': '',
+    'date': '',
+}
+# Shot results Understat records as a goal for the shooter
+GOAL_RESULTS = frozenset({"Goal"})
+# Fields kept per shot in a player's shot_data
+SHOT_DATA_COLUMNS = ['xG', 'result', 'minute', 'match_id', 'date']
+# Flattened get_league_results fields read for team stats
+MATCH_COLUMNS = ['h.title', 'xG.h', 'a.title', 'xG.a', 'datetime']
+# Fields kept per match in a team's matches_data
+TEAM_MATCH_COLUMNS = ['opponent', 'xG', 'xG_against', 'is_home', 'date']
+
+
+@dataclass
+class ShotTable:
+    """
+    A season of shots as parallel arrays (one entry per shot, SHOT_DATA_COLUMNS),
+    plus each player's row indices into them.
+    
+    Saved shot_data keeps result and date as Understat's strings; xG, minute and
+    match_id are saved as numbers rather than the strings Understat sends.
+    """
+    xG: np.ndarray             # float64
+    result: np.ndarray         # int8 codes into result_labels
+    result_labels: np.ndarray  # result strings as Understat sends them
+    minute: np.ndarray         # int16, 0 where missing
+    match_id: np.ndarray       # int32, -1 where missing
+    date: np.ndarray           # Understat's date strings ("2024-08-17 14:00:00"), '' where missing
+    player_offsets: dict       # player name -> int32 row indices, in shot order
+    
+    @classmethod
+    def from_frame(cls, shots: pd.DataFrame, player_offsets: dict) -> "ShotTable":
+        result, result_labels = pd.factorize(shots['result'].astype(str))
+        return cls(
+            xG=shots['xG'].to_numpy(np.float64),
+            result=result.astype(np.int8),
+            result_labels=np.asarray(result_labels, dtype=object),
+            minute=pd.to_numeric(shots['minute'], errors='coerce').fillna(0).to_numpy(np.int16),
+            match_id=pd.to_numeric(shots['match_id'], errors='coerce').fillna(-1).to_numpy(np.int32),
+            date=shots['date'].astype(str).to_numpy(object),
+            player_offsets={name: rows.astype(np.int32) for name, rows in player_offsets.items()},
+        )
+    
+    def player_columns(self, player_name: str) -> dict:
+        """One player's shots as a dict of JSON-ready lists, one per SHOT_DATA_COLUMNS field"""
+        rows = self.player_offsets[player_name]
+        return {
+            'xG': self.xG[rows].tolist(),
+            'result': self.result_labels[self.result[rows]].tolist(),
+            'minute': self.minute[rows].tolist(),
+            'match_id': self.match_id[rows].tolist(),
+            'date': self.date[rows].tolist(),
+        }
+    
+    def records(self, player_name: str):
+        """Yield one player's shots one dict at a time, for consumers that want per-shot records"""
+        columns = self.player_columns(player_name)
+        for values in zip(*columns.values()):
+            yield dict(zip(SHOT_DATA_COLUMNS, values))
+
+
+@dataclass(slots=True)
+class PlayerStat:
+    """One player's season stats; saved as a JSON object with these keys"""
+    name: str
+    team: str
+    position: str
+    shots: int = 0
+    xG: float = 0.0
+    xA: float = 0.0
+    minutes: int = 0
+    goals: int = 0
+    assists: int = 0
+    matches: int = 0
+    shot_data: dict = field(default_factory=dict)  # ShotTable.player_columns
+
+
+@dataclass(slots=True)
+class TeamStat:
+    """One team's season stats; saved as a JSON object with these keys"""
+    name: str
+    xG_for: float = 0.0
+    xG_against: float = 0.0
+    matches_played: int = 0
+    matches_data: list = field(default_factory=list)  # TEAM_MATCH_COLUMNS dicts
+
+
+async def _get_data(session, url, data_type):
+    """
+    understat's get_data, raising on error statuses so rate limits can be
+    retried, and decoding the raw response bytes with orjson when available
+    """
+    async with session.get(url, headers={'X-Requested-With': 'XMLHttpRequest'}) as response:
+        response.raise_for_status()
+        payload = await response.read()
+    return orjson.loads(payload) if orjson is not None else json.loads(payload)
+
+
+# Every Understat method loads its payload through this one function
+understat_api.get_data = _get_data
+
+
+def _retry_after(error):
+    """Seconds a 429 response asked to wait in its Retry-After header, or None"""
+    value = (error.headers or {}).get('Retry-After')
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+@njit(cache=True, nogil=True)
+def _reduce_shots(player_ids, xg, xa, is_goal, n_players):
+    """Per-player (shots, xG, xA, goals) totals of per-shot arrays, by factorized player id."""
+    shots = np.zeros(n_players, dtype=np.int64)
+    total_xg = np.zeros(n_players)
+    total_xa = np.zeros(n_players)
+    goals = np.zeros(n_players, dtype=np.int64)
+    for i in range(len(player_ids)):
+        pid = player_ids[i]
+        shots[pid] += 1
+        total_xg[pid] += xg[i]
+        total_xa[pid] += xa[i]
+        if is_goal[i]:
+            goals[pid] += 1
+    return shots, total_xg, total_xa, goals
+
+
+def _team_side(team, opponent, xg, xg_against, is_home, date, index):
+    """One side's view of each match, as the rows of a team's matches_data"""
+    return pd.DataFrame({
+        'name': team, 'opponent': opponent, 'xG': xg,
+        'xG_against': xg_against, 'is_home': is_home, 'date': date
+    }).set_axis(index)
+
 
 class UnderstatScraper:
     """Scraper for Understat data using the official library"""
     
-    def __init__(self):
-        """Initialize Understat scraper"""
+    def __init__(self, session=None, understat=None):
+        """
+        Initialize Understat scraper.
+        
+        Args:
+            session: aiohttp session to make requests with; the shared pooled
+                one from http_client if omitted
+            understat: Understat client every method uses by default; one on
+                `session` if omitted
+        """
         self.season = 2024
+        self.session = session
+        self.understat = understat
+        # ShotTable of the shots behind the last get_player_stats result
+        self.shots = None
+        # (season, endpoint) -> (expiry time, result) of recent fetches
+        self._cache = {}
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    
+    def _understat(self):
+        if self.understat is not None:
+            return self.understat
+        return Understat(self.session or get_session())
+    
+    def _cached(self, endpoint):
+        entry = self._cache.get((self.season, endpoint))
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+    
+    def _store(self, endpoint, value):
+        self._cache[(self.season, endpoint)] = (time.monotonic() + CACHE_TTL, value)
+    
+    def invalidate(self):
+        """Forget cached stats so the next calls fetch them from Understat again"""
+        self._cache.clear()
+    
+    async def _with_retry(self, fetch, *args):
+        """
+        Await fetch(*args) within MAX_CONCURRENCY. Connection errors, timeouts and
+        429/5xx responses are retried with jittered exponential backoff, or after
+        the Retry-After a 429 asks for.
+        """
+        async with self._semaphore:
+            for attempt in range(MAX_RETRIES):
+                try:
+                    return await fetch(*args)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    status = e.status if isinstance(e, aiohttp.ClientResponseError) else None
+                    if status is not None and status != 429 and status < 500:
+                        raise
+                    if attempt == MAX_RETRIES - 1:
+                        raise
+                    delay = _retry_after(e) if status == 429 else None
+                    if delay is None:
+                        delay = random.uniform(0, min(MAX_BACKOFF, BACKOFF_BASE * 2 ** attempt))
+                    logger.warning(f"Understat request failed ({status or type(e).__name__}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+    
+    async def _fetch_league_shots(self, understat):
+        """
+        Fetch every shot of the season. Understat only serves shots per player,
+        so this fans out over the league's teams and then their players.
+        
+        Returns:
+            list of shot dicts, each tagged with the shooter's player_name, team_name
+            and position from their squad listing
+        """
+        teams = await self._with_retry(understat.get_teams, LEAGUE, self.season)
+        squads = await asyncio.gather(*(
+            self._with_retry(understat.get_team_players, team['title'], self.season)
+            for team in teams
+        ))
+        # A player who moved mid-season is listed by both teams
+        players = {player['id']: player for player in itertools.chain.from_iterable(squads)}
+        
+        season_filter = {'season': str(self.season)}
+        player_shots = await asyncio.gather(*(
+            self._with_retry(understat.get_player_shots, player_id, season_filter)
+            for player_id in players
+        ))
+        return [
+            {
+                **shot,
+                'player_name': player['player_name'],
+                'team_name': player['team_title'],
+                'position': player.get('position', ''),
+            }
+            for player, shots in zip(players.values(), player_shots)
+            for shot in shots
+        ]
+        
+    async def fetch_all(self):
+        """
+        Fetch player and team stats concurrently.
+        
+        Returns:
+            tuple of (player stats, team stats), as from the methods below
+        """
+        understat = self._understat()
+        return await asyncio.gather(
+            self.get_player_stats(understat), self.get_team_stats(understat)
+        )
+    
+    async def iter_player_stats(self, understat=None):
+        """
+        Fetch player statistics including xG, xA, minutes, and shot data,
+        yielding one player's record at a time. The whole season's shots are
+        still fetched and kept in self.shots before the first record; only the
+        per-player records, and their shot_data lists, are built lazily.
+        Unlike get_player_stats, errors are raised and nothing is cached.
         
-    async def get_player_stats(self):
+        Args:
+            understat: Understat client to use; the scraper's own if omitted
+        
+        Yields:
+            PlayerStat of each player, in order of the player's first shot
+        """
+        if understat is None:
+            understat = self._understat()
+        
+        # Get shot map data for all players in EPL
+        logger.info(f"Fetching player data for {self.season} season...")
+        
+        # Get player stats
+        players_data = await self._fetch_league_shots(understat)
+        
+        # Parse into structured format: one row per shot, totalled per player
+        shots = pd.DataFrame(players_data)
+        for column, default in SHOT_DEFAULTS.items():
+            shots[column] = shots[column].fillna(default) if column in shots else default
+        # Converted once here for the totals and shot_data alike; empty strings count as 0
+        shots['xG'] = pd.to_numeric(shots['xG'], errors='coerce').fillna(0.0)
+        shots['xA'] = pd.to_numeric(shots['xA'], errors='coerce').fillna(0.0)
+        shots['goal'] = shots['result'].isin(GOAL_RESULTS)
+        
+        # Players numbered in order of their first shot; the compiled reduction
+        # runs off the event loop so other fetches keep going meanwhile
+        player_ids, player_names = pd.factorize(shots['player_name'])
+        shot_counts, xg_totals, xa_totals, goal_counts = await asyncio.get_running_loop().run_in_executor(
+            None, _reduce_shots, player_ids,
+            shots['xG'].to_numpy(np.float64), shots['xA'].to_numpy(np.float64),
+            shots['goal'].to_numpy(np.bool_), len(player_names)
+        )
+        player_rows = np.split(np.argsort(player_ids, kind='stable'), np.cumsum(shot_counts)[:-1])
+        table = ShotTable.from_frame(shots, dict(zip(player_names, player_rows)))
+        self.shots = table
+        
+        # Team and position are taken from each player's first shot
+        first_rows = [rows[0] for rows in player_rows] if len(player_names) else []
+        teams = shots['team_name'].to_numpy()[first_rows]
+        positions = shots['position'].to_numpy()[first_rows]
+        
+        for player_name, team, position, n_shots, xg, xa, goals in zip(
+            player_names, teams, positions, shot_counts.tolist(),
+            xg_totals.tolist(), xa_totals.tolist(), goal_counts.tolist()
+        ):
+            yield PlayerStat(
+                name=player_name,
+                team=team,
+                position=position,
+                shots=n_shots,
+                xG=xg,
+                xA=xa,
+                goals=goals,
+                shot_data=table.player_columns(player_name)
+            )
+    
+    async def get_player_stats(self, understat=None):
         """
         Fetch player statistics including xG, xA, minutes, and shot data.
         
+        Args:
+            understat: Understat client to use; the scraper's own if omitted
+        
         Returns:
-            dict with player stats indexed by player name
+            dict of PlayerStat indexed by player name, reused for CACHE_TTL
+            seconds after a successful fetch
         """
+        cached = self._cached('player_stats')
+        if cached is not None:
+            return cached
+        
         try:
-            async with Understat() as understat:
-                # Get shot map data for all players in EPL
-                logger.info(f"Fetching player data for {self.season} season...")
-                
-                # Get player stats
-                players_data = await understat.get_player_shots(team="")
-                
-                # Parse into structured format
-                player_stats = {}
-                for shot in players_data:
-                    player_name = shot.get('player_name', '')
-                    if player_name not in player_stats:
-                        player_stats[player_name] = {
-                            'name': player_name,
-                            'team': shot.get('team_name', ''),
-                            'position': shot.get('player_assisted_shot', {}).get('position', ''),
-                            'shots': 0,
-                            'xG': 0.0,
-                            'xA': 0.0,
-                            'minutes': 0,
-                            'goals': 0,
-                            'assists': 0,
-                            'matches': 0,
-                            'shot_data': []
-                        }
-                    
-                    # Accumulate shot data
-                    player_stats[player_name]['shots'] += 1
-                    player_stats[player_name]['xG'] += float(shot.get('xG', 0))
-                    player_stats[player_name]['xA'] += float(shot.get('xA', 0))
-                    if int(shot.get('result', '')) == 1:  # Goal
-                        player_stats[player_name]['goals'] += 1
-                    
-                    player_stats[player_name]['shot_data'].append({
-                        'xG': float(shot.get('xG', 0)),
-                        'result': shot.get('result', ''),
-                        'minute': shot.get('minute', 0),
-                        'match_id': shot.get('match_id', ''),
-                        'date': shot.get('date', '')
-                    })
-                
-                logger.info(f"Fetched data for {len(player_stats)} players")
-                return player_stats
-                
+            player_stats = {
+                record.name: record async for record in self.iter_player_stats(understat)
+            }
+            logger.info(f"Fetched data for {len(player_stats)} players")
+            self._store('player_stats', player_stats)
+            return player_stats
+            
         except Exception as e:
             logger.error(f"Error fetching player shots from Understat: {e}")
             return {}
     
-    async def get_team_stats(self):
+    async def get_team_stats(self, understat=None):
         """
         Fetch team-level statistics including xG, xGA, and defensive metrics.
         
+        Args:
+            understat: Understat client to use; the scraper's own if omitted
+        
         Returns:
-            dict with team stats indexed by team name
+            dict of TeamStat indexed by team name, reused for CACHE_TTL
+            seconds after a successful fetch
         """
+        cached = self._cached('team_stats')
+        if cached is not None:
+            return cached
+        if understat is None:
+            understat = self._understat()
+        
         try:
-            async with Understat() as understat:
-                logger.info(f"Fetching team stats for {self.season} season...")
-                
-                # Get all matches/teams data
-                # The library provides team data through matches
-                team_stats = {}
-                
-                # Fetch match data to build team stats
-                matches = await understat.get_matches("EPL")
-                
-                for match in matches:
-                    home_team = match.get('home', {}).get('team_name', '')
-                    away_team = match.get('away', {}).get('team_name', '')
-                    
-                    if home_team not in team_stats:
-                        team_stats[home_team] = {
-                            'name': home_team,
-                            'xG_for': 0.0,
-                            'xG_against': 0.0,
-                            'matches_played': 0,
-                            'matches_data': []
-                        }
-                    
-                    if away_team not in team_stats:
-                        team_stats[away_team] = {
-                            'name': away_team,
-                            'xG_for': 0.0,
-                            'xG_against': 0.0,
-                            'matches_played': 0,
-                            'matches_data': []
-                        }
-                    
-                    # Home team stats
-                    home_xg = float(match.get('home', {}).get('xG', 0))
-                    away_xg = float(match.get('away', {}).get('xG', 0))
-                    
-                    team_stats[home_team]['xG_for'] += home_xg
-                    team_stats[home_team]['xG_against'] += away_xg
-                    team_stats[home_team]['matches_played'] += 1
-                    team_stats[home_team]['matches_data'].append({
-                        'opponent': away_team,
-                        'xG': home_xg,
-                        'xG_against': away_xg,
-                        'is_home': True,
-                        'date': match.get('date', '')
-                    })
-                    
-                    # Away team stats
-                    team_stats[away_team]['xG_for'] += away_xg
-                    team_stats[away_team]['xG_against'] += home_xg
-                    team_stats[away_team]['matches_played'] += 1
-                    team_stats[away_team]['matches_data'].append({
-                        'opponent': home_team,
-                        'xG': away_xg,
-                        'xG_against': home_xg,
-                        'is_home': False,
-                        'date': match.get('date', '')
-                    })
-                
-                logger.info(f"Fetched stats for {len(team_stats)} teams")
-                return team_stats
-                
+            logger.info(f"Fetching team stats for {self.season} season...")
+            
+            # Get all matches/teams data
+            # The library provides team data through the season's played matches,
+            # flattened here to h.title, xG.h, a.title, xG.a and datetime columns
+            results = await self._with_retry(understat.get_league_results, LEAGUE, self.season)
+            matches = pd.json_normalize(results).reindex(columns=MATCH_COLUMNS)
+            home_team = matches['h.title'].fillna('')
+            away_team = matches['a.title'].fillna('')
+            home_xg = pd.to_numeric(matches['xG.h'], errors='coerce').fillna(0.0)
+            away_xg = pd.to_numeric(matches['xG.a'], errors='coerce').fillna(0.0)
+            date = matches['datetime'].fillna('')
+            
+            # One row per team per match, the home side before the away side so
+            # each team's matches keep the order Understat lists them in
+            home_rows = np.arange(len(matches)) * 2
+            sides = pd.concat([
+                _team_side(home_team, away_team, home_xg, away_xg, True, date, home_rows),
+                _team_side(away_team, home_team, away_xg, home_xg, False, date, home_rows + 1),
+            ]).sort_index()
+            
+            # Team stats as parallel arrays indexed by team id, ids numbered in
+            # order of each team's first match
+            team_ids, team_names = pd.factorize(sides['name'])
+            n_teams = len(team_names)
+            xg_for = np.bincount(team_ids, weights=sides['xG'].to_numpy(), minlength=n_teams)
+            xg_against = np.bincount(team_ids, weights=sides['xG_against'].to_numpy(), minlength=n_teams)
+            played = np.bincount(team_ids, minlength=n_teams)
+            
+            # Each team's rows of `sides`, still in match order
+            match_records = sides[TEAM_MATCH_COLUMNS].to_dict('records')
+            match_rows = np.split(np.argsort(team_ids, kind='stable'), np.cumsum(played)[:-1])
+            
+            team_stats = {
+                team_name: TeamStat(
+                    name=team_name,
+                    xG_for=float(xg_for[i]),
+                    xG_against=float(xg_against[i]),
+                    matches_played=int(played[i]),
+                    matches_data=[match_records[row] for row in match_rows[i]]
+                )
+                for i, team_name in enumerate(team_names)
+            }
+            
+            logger.info(f"Fetched stats for {len(team_stats)} teams")
+            self._store('team_stats', team_stats)
+            return team_stats
+            
         except Exception as e:
             logger.error(f"Error fetching team stats from Understat: {e}")
             return {}